@@ -2,6 +2,8 @@ import os
 from ctypes import *
 from typing import List
 
+import numpy as np
+
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst  # noqa:F401,F402
@@ -24,6 +26,19 @@ class GstObjectInfoArray(Structure):
 
 GstObjectInfoArrayPtr = POINTER(GstObjectInfoArray)
 
+# NumPy view of GstObjectInfo, class_name is the char pointer
+OBJECT_INFO_DTYPE = np.dtype([("x", np.int32),
+                              ("y", np.int32),
+                              ("width", np.int32),
+                              ("height", np.int32),
+                              ("confidence", np.float32),
+                              ("class_name", np.uintp),
+                              ("track_id", np.int32)], align=True)
+assert OBJECT_INFO_DTYPE.itemsize == sizeof(GstObjectInfo)
+
+# Class names referenced by objects written with gst_meta_write_array, kept alive for the lifetime of the process
+_class_names = dict()
+
 cwd = os.path.dirname(os.path.abspath(__file__))
 libc = CDLL(os.path.join(cwd, "libgst_objects_info_meta.so"))
 
@@ -82,6 +97,34 @@ def gst_meta_get(buffer: Gst.Buffer) -> List[dict]:
     return to_list(res.contents)
 
 
+def class_name_ptr(class_name: str) -> int:
+    """ Address of the class name string for the class_name field of OBJECT_INFO_DTYPE, valid for the process lifetime"""
+    name = _class_names.get(class_name)
+    if name is None:
+        name = create_string_buffer(class_name.encode("utf-8"))
+        _class_names[class_name] = name
+    return addressof(name)
+
+
+def gst_meta_write_array(buffer: Gst.Buffer, objects: np.ndarray):
+    """ Writes objects from NumPy structured array of OBJECT_INFO_DTYPE to Gst.Buffer, without per-object conversion"""
+    objects = np.ascontiguousarray(objects, dtype=OBJECT_INFO_DTYPE)
+    gst_objects_info = GstObjectInfoArray()
+    gst_objects_info.size = len(objects)
+    gst_objects_info.items = cast(objects.ctypes.data, POINTER(GstObjectInfo)) if len(objects) > 0 else None
+    _ = libc.gst_buffer_add_objects_info_meta(hash(buffer), gst_objects_info)
+
+
+def gst_meta_get_array(buffer: Gst.Buffer) -> np.ndarray:
+    """ Gets objects from Gst.Buffer as NumPy structured array of OBJECT_INFO_DTYPE, without per-object conversion"""
+    res = libc.gst_buffer_get_objects_info_meta(hash(buffer))
+    if not res or res.contents.size <= 0 or not res.contents.items:
+        return np.empty(0, dtype=OBJECT_INFO_DTYPE)
+    items = res.contents
+    data = (c_char * (items.size * sizeof(GstObjectInfo))).from_address(addressof(items.items.contents))
+    return np.frombuffer(data, dtype=OBJECT_INFO_DTYPE).copy()
+
+
 def gst_meta_remove(buffer: Gst.Buffer):
     """ Removes all objects from Gst.Buffer """
     libc.gst_buffer_remove_objects_info_meta(hash(buffer))
\ No newline at end of file
@@ -5,6 +5,10 @@
 import os
 import glob
 import logging
+from collections import deque
+from contextlib import ExitStack
+from threading import Lock
+import numpy as np
 
 import gi
 gi.require_version('Gst', '1.0')
@@ -14,11 +18,26 @@ from .stream_pipeline import StreamPipeline
 from .stream_config import StreamConfig
 from .stream_graph import StreamGraph
 from .video_pipeline import VideoPipeline
+from ..utils.gst import VideoLayout, map_gst_buffer_to_writable_ndarray
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class AppSrcPipeline(StreamPipeline):
+
+    # Number of buffers preallocated in the pool
+    MIN_POOL_BUFFERS = 2
+
+    # Default number of frames queued in appsrc before it signals enough-data
+    DEFAULT_QUEUE_SIZE = 2
+
+    # What push does when appsrc queue is full:
+    #   block: wait until there is space (throttles the producer)
+    #   drop-oldest: keep up to queue_size pending frames, dropping the oldest one
+    #   drop-newest: drop the frame being pushed
+    #   coalesce: keep only the latest pending frame
+    PUSH_POLICIES = ["block", "drop-oldest", "drop-newest", "coalesce"]
+
     def __init__(self, config):
         logger.info("Initializing %s..." % self.__class__.__name__)
         super().__init__(config)
@@ -45,13 +64,31 @@ class AppSrcPipeline(StreamPipeline):
     def configure(self, config):
         logger.info("Configuring %s..." % self.__class__.__name__)
 
+        # Configure push policy
+        self.push_policy = config.get("source.push_policy") if config.isSet("source.push_policy") else "block"
+        if self.push_policy not in AppSrcPipeline.PUSH_POLICIES:
+            raise Exception("Unknown push policy '%s', expected one of: %s" % (self.push_policy, AppSrcPipeline.PUSH_POLICIES))
+        self.queue_size = config.get("source.queue_size") if config.isSet("source.queue_size") else AppSrcPipeline.DEFAULT_QUEUE_SIZE
+        self.pending = deque(maxlen=1 if self.push_policy == "coalesce" else self.queue_size)
+        self.accepting = True
+        self.pushed = 0
+        self.dropped = 0
+        self.lock = Lock()
+
+        # Frame timing
+        self.duration = Gst.SECOND // config.get("source.fps")
+        self.last_pts = None
+        self.jitter = 0
+
         # Configure source
         self.graph["source"].set_property("name", "source")
         self.graph["source"].set_property("emit-signals", True)
         self.graph["source"].set_property("do-timestamp", True)
         self.graph["source"].set_property("is-live", True)
-        self.graph["source"].set_property("block", True)
+        self.graph["source"].set_property("block", self.push_policy == "block")
         self.graph["source"].set_property("format", 3)
+        self.graph["source"].connect("need-data", self.on_need_data)
+        self.graph["source"].connect("enough-data", self.on_enough_data)
 
         # Configure source filter
         img_format = config.get("source.img_format") if config.isSet("source.img_format") else "BGR"
@@ -61,6 +98,12 @@ class AppSrcPipeline(StreamPipeline):
         source_caps = Gst.caps_from_string(caps_str)
         self.graph["source_filter"].set_property("caps", source_caps)
 
+        # Buffer pool for frames rendered directly into GStreamer memory
+        self.layout = VideoLayout.from_caps(source_caps)
+        self.pool = AppSrcPipeline.create_buffer_pool(source_caps, self.layout.size)
+        self.frames = dict()
+        self.graph["source"].set_property("max-bytes", self.queue_size * self.layout.size)
+
         # Configure encoder_filter
         if self.graph.contains("encoder_filter"):
             caps_str = 'video/x-h264, profile=main'
@@ -71,5 +114,164 @@ class AppSrcPipeline(StreamPipeline):
         # Configure sink pipeline
         VideoPipeline.configure_sink(self.graph, config)
 
-    def push(self, img):
-        self.get("source").emit("push-buffer", Gst.Buffer.new_wrapped(img.tobytes()))
+    @staticmethod
+    def create_buffer_pool(caps, size):
+        '''
+        Creates and activates buffer pool for buffers of a given caps and size
+        '''
+        pool = Gst.BufferPool.new()
+        pool_config = pool.get_config()
+        Gst.BufferPool.config_set_params(pool_config, caps, size, AppSrcPipeline.MIN_POOL_BUFFERS, 0)
+        if not pool.set_config(pool_config) or not pool.set_active(True):
+            raise Exception("Failed to configure buffer pool for caps: %s" % caps.to_string())
+        return pool
+
+    def acquire_frame(self):
+        '''
+        Returns writable ndarray backed by a pooled buffer, submit it with push_frame()
+        or give it back with release_frame(). Do not use the array afterwards.
+        '''
+        ret, buffer = self.pool.acquire_buffer(None)
+        if ret != Gst.FlowReturn.OK:
+            raise Exception("Failed to acquire buffer from the pool: %s" % ret)
+        stack = ExitStack()
+        frame = stack.enter_context(map_gst_buffer_to_writable_ndarray(buffer, self.layout))
+        self.frames[id(frame)] = (buffer, stack)
+        return frame
+
+    def release_frame(self, frame):
+        '''
+        Returns frame acquired with acquire_frame() to the pool without pushing it
+        '''
+        buffer, stack = self.frames.pop(id(frame))
+        stack.close()
+
+    def push_frame(self, frame, timestamp=None):
+        '''
+        Pushes frame acquired with acquire_frame() without copying.
+        Timestamp is the capture time returned by get_clock_time().
+        '''
+        buffer, stack = self.frames.pop(id(frame))
+        stack.close()
+        self.stamp(buffer, timestamp)
+        return self.push_buffer(buffer)
+
+    def get_clock_time(self):
+        '''
+        Returns current time of the pipeline clock (None until the pipeline is playing),
+        producers should call it at capture and pass it to push()/push_frame()
+        '''
+        clock = self.pipeline.get_clock()
+        return clock.get_time() if clock is not None else None
+
+    def stamp(self, buffer, timestamp=None):
+        '''
+        Sets PTS/DTS to the running time of the capture and duration from the source fps
+        '''
+        if timestamp is None:
+            timestamp = self.get_clock_time()
+            if timestamp is None:
+                # No clock yet, leave it to do-timestamp
+                return
+
+        pts = max(0, timestamp - self.pipeline.get_base_time())
+        buffer.pts = pts
+        buffer.dts = pts
+        buffer.duration = self.duration
+
+        # Interarrival jitter estimate as in RFC 3550
+        if self.last_pts is not None:
+            deviation = abs((pts - self.last_pts) - self.duration)
+            self.jitter += (deviation - self.jitter) / 16
+        self.last_pts = pts
+
+    def push_buffer(self, buffer):
+        '''
+        Pushes buffer to appsrc according to the push policy
+        '''
+        with self.lock:
+            if self.push_policy != "block" and not self.accepting:
+                if self.push_policy == "drop-newest":
+                    self.dropped += 1
+                    return Gst.FlowReturn.OK
+                if len(self.pending) == self.pending.maxlen:
+                    self.dropped += 1
+                self.pending.append(buffer)
+                return Gst.FlowReturn.OK
+            if len(self.pending) == 0:
+                self.pushed += 1
+            else:
+                # Keep the order: frames still pending go first
+                self.pending.append(buffer)
+                buffer = None
+        if buffer is None:
+            self.flush_pending(self.graph["source"])
+            return Gst.FlowReturn.OK
+        return self.graph["source"].emit("push-buffer", buffer)
+
+    def on_need_data(self, src, length):
+        '''
+        Callback function called when appsrc queue runs empty: flushes pending frames
+        '''
+        with self.lock:
+            self.accepting = True
+        self.flush_pending(src)
+
+    def flush_pending(self, src):
+        '''
+        Pushes pending frames while appsrc is accepting them
+        '''
+        while True:
+            with self.lock:
+                if not self.accepting or len(self.pending) == 0:
+                    break
+                buffer = self.pending.popleft()
+                self.pushed += 1
+            src.emit("push-buffer", buffer)
+
+    def on_enough_data(self, src):
+        '''
+        Callback function called when appsrc queue is full
+        '''
+        with self.lock:
+            self.accepting = False
+
+    def get_queue_depth(self):
+        '''
+        Returns number of frames queued in appsrc
+        '''
+        source = self.graph["source"]
+        if source.find_property("current-level-buffers") is not None:
+            return source.get_property("current-level-buffers")
+        return source.get_property("current-level-bytes") // self.layout.size
+
+    def get_stats(self):
+        '''
+        Returns push statistics
+        '''
+        return {
+            "policy": self.push_policy,
+            "queue_depth": self.get_queue_depth(),
+            "pending": len(self.pending),
+            "pushed": self.pushed,
+            "dropped": self.dropped,
+            "jitter_ms": self.jitter / Gst.MSECOND
+        }
+
+    def push(self, img, timestamp=None):
+        '''
+        Copies image to a pooled buffer and pushes it
+        '''
+        frame = self.acquire_frame()
+        if isinstance(frame, np.ndarray) and frame.shape == img.shape:
+            np.copyto(frame, img)
+            return self.push_frame(frame, timestamp)
+
+        self.release_frame(frame)
+        buffer = Gst.Buffer.new_wrapped(img.tobytes())
+        self.stamp(buffer, timestamp)
+        return self.push_buffer(buffer)
+
+    def stop(self):
+        super().stop()
+        self.pool.set_active(False)
@@ -0,0 +1,142 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import numpy as np
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from .stream_pipeline import StreamPipeline
+from .video_pipeline import VideoPipeline
+from .frame_bus import FrameBus
+from ..utils.gst import VideoLayout, VideoLayoutCache
+from ..utils.gst_hacks import map_gst_buffer
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class FrameBusSinkPipeline(StreamPipeline):
+    '''
+    Decodes the source once and publishes raw frames to the shared memory frame bus,
+    which pipelines in other processes subscribe to with the "bus_src" pipeline:
+    source ! [depay ! parse] ! decoder ! videoconvert ! videoscale ! capsfilter ! appsink
+    '''
+
+    # Number of frames kept in the ring, subscribers lagging behind more than that drop frames
+    DEFAULT_SLOTS = 8
+
+    def __init__(self, config):
+        logger.info("Initializing %s..." % self.__class__.__name__)
+        super().__init__(config)
+
+    def build(self, config):
+        logger.info("Building %s..." % self.__class__.__name__)
+
+        # Source and decoder
+        self.graph.add(config.get("source.name"), "source")
+        if config.get("source.name") == "rtspsrc":
+            self.graph.add_pipeline({
+                "depay": "rtph264depay",
+                "parse": "h264parse",
+                "decoder": "avdec_h264"
+            })
+        elif "filesrc" in config.get("source.name"):
+            self.graph.add("decodebin", "decoder")
+        else:
+            self.graph.add("capsfilter", "source_filter")
+
+        # Raw frames to the frame bus
+        self.graph.add_pipeline({
+            "convert": "videoconvert",
+            "scale": "videoscale",
+            "convert_filter": "capsfilter",
+            "sink": "appsink"
+        })
+
+    def configure(self, config):
+        logger.info("Configuring %s..." % self.__class__.__name__)
+
+        # Configure source pipeline
+        VideoPipeline.configure_source(self.graph, config, link_filesrc=True)
+        if self.graph.contains("decoder") and self.graph.get("decoder").factory_name == "decodebin":
+            self.graph.get("decoder").linkable = False
+
+        # Configure output format
+        img_format = config.get("sink.img_format") if config.isSet("sink.img_format") else "BGR"
+        caps_str = "video/x-raw,format=%s" % img_format
+        if config.isSet("sink.width") and config.isSet("sink.height"):
+            caps_str += ",width=%d,height=%d" % (config.get("sink.width"), config.get("sink.height"))
+        config["convert_filter"] = { "caps": caps_str }
+        self.graph["convert_filter"].set_property("caps", Gst.caps_from_string(caps_str))
+
+        # Configure frame bus
+        self.bus_name = config.get("sink.bus") if config.isSet("sink.bus") else str(config["id"])
+        self.slots = config.get("sink.slots") if config.isSet("sink.slots") else FrameBusSinkPipeline.DEFAULT_SLOTS
+        self.bus = None
+        self.layouts = VideoLayoutCache()
+        self.published = 0
+
+        # Configure sink
+        self.graph["sink"].set_property("emit-signals", True)
+        self.graph["sink"].set_property("sync", False)
+        self.graph["sink"].set_property("drop", True)
+        self.graph["sink"].set_property("max-buffers", 1)
+        self.graph["sink"].connect("new-sample", self.on_new_sample)
+
+    def on_new_sample(self, sink):
+        '''
+        Callback function called on new decoded frame: copies it to the next slot of the frame bus
+        '''
+        sample = sink.emit("pull-sample")
+        if sample is None:
+            return Gst.FlowReturn.OK
+
+        # Without width and height configured, frame bus is created on the first frame, when the frame size is known
+        if self.bus is None:
+            try:
+                self.open_bus(self.layouts.get(sample.get_caps()).size)
+            except Exception as e:
+                logger.error("Failed to create frame bus '%s': %s" % (self.bus_name, repr(e)))
+                return Gst.FlowReturn.ERROR
+
+        buffer = sample.get_buffer()
+        if buffer.get_size() > self.bus.slot_size:
+            logger.error("Frame of %d bytes does not fit into the frame bus, dropping it" % buffer.get_size())
+            return Gst.FlowReturn.OK
+
+        pts = buffer.pts if buffer.pts != Gst.CLOCK_TIME_NONE else -1
+        with map_gst_buffer(buffer, Gst.MapFlags.READ) as mapped:
+            self.bus.publish(np.ndarray(len(mapped), dtype=np.uint8, buffer=mapped), pts)
+        self.published += 1
+
+        return Gst.FlowReturn.OK
+
+    def open_bus(self, slot_size):
+        '''
+        Creates the frame bus, replacing a stale one left behind by a previous publisher
+        '''
+        logger.info("Creating frame bus '%s' with %d slots of %d bytes" % (self.bus_name, self.slots, slot_size))
+        self.bus = FrameBus.create_or_replace(self.bus_name, self.slots, slot_size)
+
+    def close_bus(self):
+        '''
+        Removes the frame bus, subscribers keep their mappings until they close them
+        '''
+        if self.bus is not None:
+            self.bus.close()
+            self.bus = None
+
+    def start(self, loop=None):
+        # Frame size is known upfront if width and height are configured
+        if self.bus is None and self.config.isSet("sink.width") and self.config.isSet("sink.height"):
+            caps = Gst.caps_from_string(self.config.get("convert_filter.caps"))
+            self.open_bus(VideoLayout.from_caps(caps).size)
+        super().start(loop)
+        if loop is None:
+            self.close_bus()
+
+    def stop(self):
+        super().stop()
+        self.close_bus()
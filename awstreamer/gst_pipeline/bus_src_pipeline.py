@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+from threading import Thread
+import numpy as np
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from .appsrc_pipeline import AppSrcPipeline
+from .frame_bus import FrameBus, FrameBusSubscriber
+from ..utils.gst_hacks import map_gst_buffer_writable
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class FrameBusSrcPipeline(AppSrcPipeline):
+    '''
+    Subscribes to the frame bus published by the "bus_sink" pipeline in another process
+    and pushes its frames to appsrc. Source width, height, fps and img_format have to match
+    the published frames. Frames are read in place from shared memory and copied once,
+    straight into a pooled buffer; when this pipeline falls behind, it skips to the latest frame.
+    '''
+
+    # Seconds to wait for the publisher to create the frame bus
+    DEFAULT_OPEN_TIMEOUT = 30
+
+    def __init__(self, config):
+        logger.info("Initializing %s..." % self.__class__.__name__)
+        super().__init__(config)
+
+    def configure(self, config):
+        super().configure(config)
+
+        self.bus_name = config.get("source.bus")
+        self.open_timeout = config.get("source.open_timeout") if config.isSet("source.open_timeout") \
+            else FrameBusSrcPipeline.DEFAULT_OPEN_TIMEOUT
+        self.bus = None
+        self.subscriber = None
+        self.running = False
+        self.overwritten = 0
+
+    def read(self):
+        '''
+        Thread loop: copies frames from the frame bus to appsrc until stopped.
+        Failure is posted as an error on the pipeline bus, so that it stops the pipeline.
+        '''
+        try:
+            self.bus = FrameBus.open(self.bus_name, timeout=self.open_timeout)
+            self.subscriber = FrameBusSubscriber(self.bus)
+            logger.info("Subscribed to frame bus '%s'" % self.bus_name)
+
+            while self.running:
+                frame = self.subscriber.next(timeout=1.0)
+                if frame is None:
+                    continue
+                seq, pts, view = frame
+                if len(view) != self.layout.size:
+                    logger.error("Frame of %d bytes does not match the source caps (%d bytes)" % (len(view), self.layout.size))
+                    continue
+
+                ret, buffer = self.pool.acquire_buffer(None)
+                if ret != Gst.FlowReturn.OK:
+                    raise Exception("Failed to acquire buffer from the pool: %s" % ret)
+                with map_gst_buffer_writable(buffer) as (mapped, copied):
+                    np.copyto(np.ndarray(len(mapped), dtype=np.uint8, buffer=mapped), view)
+
+                # Publisher has overwritten the slot while we were copying it, see FrameBus for ordering assumptions
+                if not self.bus.is_valid(seq):
+                    self.overwritten += 1
+                    continue
+
+                self.stamp(buffer)
+                self.push_buffer(buffer)
+
+        except Exception as e:
+            logger.error("Failed to read frame bus '%s': %s" % (self.bus_name, repr(e)))
+            if self.running:
+                self.post_error(repr(e))
+
+        finally:
+            if self.bus is not None:
+                self.bus.close()
+
+    def post_error(self, text):
+        '''
+        Posts error of the source on the pipeline bus, as if appsrc has failed
+        '''
+        source = self.graph["source"]
+        error = GLib.Error.new_literal(Gst.ResourceError.quark(), text, Gst.ResourceError.READ)
+        source.post_message(Gst.Message.new_error(source, error, "Frame bus '%s'" % self.bus_name))
+
+    def get_stats(self):
+        '''
+        Returns push statistics, including frames dropped by the frame bus subscriber
+        '''
+        stats = super().get_stats()
+        stats["bus_dropped"] = (self.subscriber.dropped if self.subscriber is not None else 0) + self.overwritten
+        return stats
+
+    def start(self, loop=None):
+        self.running = True
+        self.thread = Thread(target=self.read, daemon=True)
+        self.thread.start()
+        super().start(loop)
+        if loop is None:
+            self.running = False
+
+    def stop(self):
+        self.running = False
+        super().stop()
@@ -4,11 +4,22 @@
 
 import os
 import time
+import inspect
 import glob
 import logging
+import threading
+from collections import deque, defaultdict
+from threading import Thread, Condition
+from pebble import ThreadPool, ProcessPool
 import cv2
 import numpy as np
 
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    # Python < 3.8, frames are pickled instead
+    SharedMemory = None
+
 try:
     import gi
     gi.require_version('Gst', '1.0')
@@ -18,24 +29,190 @@ except:
 
 import awstreamer
 from awstreamer.gst_pipeline.stream_pipeline import StreamPipeline
+from awstreamer.gst_pipeline.gst_capture import GstCapture
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+class FrameRing():
+    '''
+    Bounded ring of captured frames between capture and processing threads.
+    When full, the oldest frame is dropped (drop=True) or put() waits for space.
+    In latest-only mode get() returns the newest frame and discards older ones.
+    '''
+    def __init__(self, size, drop=True, latest_only=False):
+        self.frames = deque()
+        self.size = size
+        self.drop = drop
+        self.latest_only = latest_only
+        self.closed = False
+        self.dropped = 0
+        self.cond = Condition()
+
+    def put(self, item):
+        '''
+        Adds item to the ring, returns False if the ring has been closed
+        '''
+        with self.cond:
+            while not self.drop and len(self.frames) >= self.size and not self.closed:
+                self.cond.wait()
+            if self.closed:
+                return False
+            if len(self.frames) >= self.size:
+                self.frames.popleft()
+                self.dropped += 1
+            self.frames.append(item)
+            self.cond.notify_all()
+            return True
+
+    def get(self):
+        '''
+        Returns next item, waits if the ring is empty. Returns None once closed and drained.
+        '''
+        with self.cond:
+            while len(self.frames) == 0 and not self.closed:
+                self.cond.wait()
+            if len(self.frames) == 0:
+                return None
+            if self.latest_only:
+                item = self.frames.pop()
+                self.dropped += len(self.frames)
+                self.frames.clear()
+            else:
+                item = self.frames.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+def process_timed(process, img):
+    '''
+    Runs process function in a worker, returns (worker id, busy time, result)
+    '''
+    start = time.time()
+    result = process(img)
+    return (os.getpid(), threading.get_ident()), time.time() - start, result
+
+def process_shared(process, name, shape, dtype):
+    '''
+    Runs process function in a worker process on a frame in shared memory.
+    Result of the same shape and type is written back to shared memory and None is returned instead.
+    '''
+    start = time.time()
+    shm = SharedMemory(name=name)
+    try:
+        img = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        result = process(img)
+        if isinstance(result, np.ndarray) and result.shape == img.shape and result.dtype == img.dtype:
+            if not np.shares_memory(result, img):
+                np.copyto(img, result)
+            result = None
+        elif isinstance(result, np.ndarray) and np.shares_memory(result, img):
+            result = result.copy()
+        del img
+    finally:
+        shm.close()
+    return (os.getpid(), threading.get_ident()), time.time() - start, result
+
+class FrameWorkers():
+    '''
+    Pool of threads or processes running process function on frames.
+    Frames are sent to processes through reusable shared memory blocks when available.
+    '''
+    def __init__(self, process, count, worker_type="thread"):
+        logger.info("Starting %d %s workers..." % (count, worker_type))
+        self.process = process
+        self.shared = worker_type == "process" and SharedMemory is not None
+        self.pool = ProcessPool(max_workers=count) if worker_type == "process" else ThreadPool(max_workers=count)
+        self.blocks = []
+        self.free_blocks = []
+        self.busy = defaultdict(float)
+        self.started = time.time()
+
+    def submit(self, img):
+        '''
+        Schedules frame processing, returns a job to be passed to collect()
+        '''
+        if not self.shared:
+            return self.pool.schedule(process_timed, args=[self.process, img]), None
+
+        # Reuse a free shared memory block large enough for the frame
+        block = next((b for b in self.free_blocks if b.size >= img.nbytes), None)
+        if block is None:
+            block = SharedMemory(create=True, size=img.nbytes)
+            self.blocks.append(block)
+        else:
+            self.free_blocks.remove(block)
+        shared_img = np.ndarray(img.shape, dtype=img.dtype, buffer=block.buf)
+        np.copyto(shared_img, img)
+        future = self.pool.schedule(process_shared, args=[self.process, block.name, img.shape, img.dtype.str])
+        return future, (block, shared_img)
+
+    def done(self, job):
+        return job[0].done()
+
+    def collect(self, job):
+        '''
+        Waits for the job and returns processed frame. Call release() once the frame is no longer used.
+        '''
+        future, shared = job
+        worker, busy, result = future.result()
+        self.busy[worker] += busy
+        if result is None and shared is not None:
+            return shared[1]
+        return result
+
+    def release(self, job):
+        future, shared = job
+        if shared is not None:
+            self.free_blocks.append(shared[0])
+
+    def get_utilisation(self):
+        '''
+        Returns fraction of time each worker spent processing
+        '''
+        elapsed = max(time.time() - self.started, 1e-6)
+        return {"%d:%d" % worker: busy / elapsed for worker, busy in self.busy.items()}
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for block in self.blocks:
+            try:
+                block.close()
+                block.unlink()
+            except Exception as e:
+                logger.warning("Failed to release shared memory block: " + repr(e))
+
 class OpenCvPipeline(StreamPipeline):
+
+    # Default number of frames read ahead by the capture thread
+    DEFAULT_RING_SIZE = 4
+
+    # Default max number of frames skipped with grab() instead of seeking, roughly a GOP
+    DEFAULT_SEEK_THRESHOLD = 30
+
     def __init__(self, config):
         logger.info("Initializing %s..." % self.__class__.__name__)
         super().__init__(config)
 
         # OpenCV source element
         src = config["source"]
-        self.source = cv2.VideoCapture(src["name"])
         self.src_type = src["type"] if "type" in src else "live"
+        self.source = self.open_source()
         self.min_idx = src["min_idx"] if "min_idx" in src else -1
         self.max_idx = src["max_idx"] if "max_idx" in src else -1
         self.step = src["step"] if "step" in src else 1
         self.restart = src["restart"] if "restart" in src else False
         self.rotate = src["rotate"] if "rotate" in src else False
+        self.seek_threshold = src["seek_threshold"] if "seek_threshold" in src else OpenCvPipeline.DEFAULT_SEEK_THRESHOLD
+        self.ring_size = src["ring_size"] if "ring_size" in src else OpenCvPipeline.DEFAULT_RING_SIZE
+        self.latest_only = src["latest_only"] if "latest_only" in src else self.src_type == "live"
+        self.workers = src["workers"] if "workers" in src else 0
+        self.worker_type = src["worker_type"] if "worker_type" in src else "thread"
 
         # OpenCV sink element
         self.sink_output = None
@@ -95,6 +272,27 @@ class OpenCvPipeline(StreamPipeline):
         if config.isSet("process"):
             self.process = config.get("process")
 
+        # Process workers receive the function pickled, bound method would pickle the whole pipeline
+        if self.workers > 1 and self.worker_type == "process" and \
+            (inspect.ismethod(self.process) or "<lambda>" in self.process.__qualname__
+             or "<locals>" in self.process.__qualname__):
+            raise Exception("Process workers require \"process\" to be a module-level function, "
+                            "use worker_type \"thread\" for methods, lambdas and nested functions")
+
+    def open_source(self):
+        '''
+        Opens video source with OpenCV (default) or GStreamer backend (source.backend = "gstreamer")
+        '''
+        src = self.config["source"]
+        if src.get("backend") == "gstreamer":
+            live = self.src_type == "live"
+            return GstCapture(src["name"],
+                              threads=src.get("decode_threads", 0),
+                              drop=src.get("drop", live),
+                              max_buffers=src.get("max_buffers", 2),
+                              zero_copy=src.get("zero_copy", False))
+        return cv2.VideoCapture(src["name"])
+
     def build(self, config):
         logger.info("Building %s..." % self.__class__.__name__)
         pass
@@ -106,30 +304,48 @@ class OpenCvPipeline(StreamPipeline):
     def process(self, img):
         return img
 
-    def start(self):
-        logger.info("Starting %s..." % self.__class__.__name__)
-
+    def seek(self, index, position):
+        '''
+        Moves source to the frame index and returns it as the new position.
+        Frames up to seek_threshold ahead of the current position are skipped with grab(),
+        which only demuxes, instead of seeking to a keyframe and decoding from it.
+        '''
+        if position is not None and 0 <= index - position <= self.seek_threshold:
+            for i in range(index - position):
+                if not self.source.grab():
+                    break
+        else:
+            self.source.set(cv2.CAP_PROP_POS_FRAMES, index)
+        return index
+
+    def capture(self, ring):
+        '''
+        Capture loop, runs in its own thread and feeds the ring with (timestamp, frame)
+        '''
         index = self.min_idx
+        position = None
 
         while True:
             try:
                 # Get desired frame from the video feed
-                if index > -1:
-                    self.source.set(1, index)
+                if index > -1 and index != position:
+                    position = self.seek(index, position)
 
                 # Capture frame
                 ret, img = self.source.read()
+                timestamp = self.sink_pipeline.get_clock_time() if self.sink_pipeline is not None else None
 
                 if not ret or img is None:
+                    position = None
                     if self.restart:
                         if self.src_type == "live":
                             logger.info("Restarting camera feed...")
-                            self.source = cv2.VideoCapture(self.config["source"]["name"])
+                            self.source = self.open_source()
                         else:
                             if self.min_idx > -1:
                                 index = self.min_idx
                             else:
-                                self.source.set(1, 0)
+                                self.source.set(cv2.CAP_PROP_POS_FRAMES, 0)
                             logger.info("Probably end of video stream. Starting over...")
                         time.sleep(1)
                         continue
@@ -137,33 +353,12 @@ class OpenCvPipeline(StreamPipeline):
                         logger.error("Can't receive frame (stream end?). Exiting ...")
                         break
 
-                # Rotate 90 degrees clock-wise
-                if self.rotate:
-                    img = cv2.transpose(img)
-                    img = cv2.flip(img, flipCode=1)
-
-                # Display
-                if self.source_window_name:
-                    cv2.imshow(self.source_window_name, img)
-
-                # Process
-                img = self.process(img)
-
-                # Dump to sink output
-                if self.sink_output is not None:
-                    self.sink_output.write(img)
-
-                # Dump to sink pipeline
-                if self.sink_pipeline is not None:
-                    img = cv2.resize(img, (self.sink_width, self.sink_height))
-                    self.sink_pipeline.push(img)
-
-                # Display
-                if self.sink_window_name:
-                    cv2.imshow(self.sink_window_name, img)
+                if position is not None:
+                    position += 1
 
-                if self.source_window_name or self.sink_window_name:
-                    cv2.waitKey(1)
+                # Hand over to processing, stop if processing has finished
+                if not ring.put((timestamp, img)):
+                    break
 
                 # Increment
                 if index > -1:
@@ -180,9 +375,134 @@ class OpenCvPipeline(StreamPipeline):
                 if self.restart:
                     logger.info("Restarting video source...")
                     index = self.min_idx
-                    self.source = cv2.VideoCapture(self.config["source"]["name"])
+                    position = None
+                    self.source = self.open_source()
                     time.sleep(1)
 
+        ring.close()
+
+    def prepare(self, img):
+        '''
+        Prepares captured frame for processing
+        '''
+        # Rotate 90 degrees clock-wise
+        if self.rotate:
+            img = cv2.transpose(img)
+            img = cv2.flip(img, flipCode=1)
+
+        # Display
+        if self.source_window_name:
+            cv2.imshow(self.source_window_name, img)
+
+        return img
+
+    def emit(self, img, timestamp):
+        '''
+        Dumps processed frame to the sinks
+        '''
+        # Dump to sink output
+        if self.sink_output is not None:
+            self.sink_output.write(img)
+
+        # Resize directly into the pooled buffer of sink pipeline
+        frame = None
+        if self.sink_pipeline is not None:
+            frame = self.sink_pipeline.acquire_frame()
+            dst = frame if isinstance(frame, np.ndarray) else None
+            img = cv2.resize(img, (self.sink_width, self.sink_height), dst=dst)
+
+        # Display
+        if self.sink_window_name:
+            cv2.imshow(self.sink_window_name, img)
+
+        # Dump to sink pipeline
+        if frame is not None:
+            if img is frame:
+                self.sink_pipeline.push_frame(frame, timestamp)
+            else:
+                # Frame format differs from the resized image, e.g. different number of channels
+                self.sink_pipeline.release_frame(frame)
+                self.sink_pipeline.push(img, timestamp)
+
+        if self.source_window_name or self.sink_window_name:
+            cv2.waitKey(1)
+
+    def handle(self, img, timestamp):
+        '''
+        Processes captured frame and dumps it to the sinks
+        '''
+        self.emit(self.process(self.prepare(img)), timestamp)
+
+    def run_inline(self):
+        '''
+        Processing loop running process function on the calling thread
+        '''
+        while True:
+            item = self.ring.get()
+            if item is None:
+                break
+            timestamp, img = item
+            try:
+                self.handle(img, timestamp)
+            except Exception as e:
+                logger.error("Exception caught in CvPipeline: " + repr(e))
+
+    def run_workers(self, workers):
+        '''
+        Processing loop dispatching process function to the workers.
+        Results are emitted in capture order.
+        '''
+        max_in_flight = 2 * self.workers
+        in_flight = deque()
+        closed = False
+        while not closed or len(in_flight) > 0:
+            # Dispatch next frame
+            if not closed and len(in_flight) < max_in_flight:
+                item = self.ring.get()
+                if item is None:
+                    closed = True
+                else:
+                    timestamp, img = item
+                    try:
+                        in_flight.append((timestamp, workers.submit(self.prepare(img))))
+                    except Exception as e:
+                        logger.error("Exception caught in CvPipeline: " + repr(e))
+
+            # Emit finished frames in order, wait for the oldest one if nothing else can be done
+            while len(in_flight) > 0 and (workers.done(in_flight[0][1]) or closed or len(in_flight) >= max_in_flight):
+                timestamp, job = in_flight.popleft()
+                try:
+                    self.emit(workers.collect(job), timestamp)
+                except Exception as e:
+                    logger.error("Exception caught in CvPipeline: " + repr(e))
+                finally:
+                    workers.release(job)
+
+    def start(self):
+        logger.info("Starting %s..." % self.__class__.__name__)
+
+        # Live sources drop stale frames, files are read ahead without losing any
+        live = self.src_type == "live"
+        self.ring = FrameRing(self.ring_size, drop=live, latest_only=self.latest_only)
+        self.capture_thread = Thread(target=self.capture, args=(self.ring,), daemon=True)
+        self.capture_thread.start()
+
+        # Process functions in worker processes must be picklable, e.g. defined at module level
+        self.frame_workers = FrameWorkers(self.process, self.workers, self.worker_type) if self.workers > 1 else None
+
+        try:
+            if self.frame_workers is None:
+                self.run_inline()
+            else:
+                self.run_workers(self.frame_workers)
+        finally:
+            self.ring.close()
+            self.capture_thread.join()
+            logger.info("Frames dropped by capture: %d" % self.ring.dropped)
+            if self.frame_workers is not None:
+                logger.info("Worker utilisation: %s" % self.frame_workers.get_utilisation())
+                self.frame_workers.close()
+
     def stop(self):
         # Closing all open windows
         cv2.destroyAllWindows()
@@ -35,9 +35,17 @@ class VideoRecorderPipeline(StreamPipeline):
         # Configure source pipeline
         VideoPipeline.configure_source(self.graph, config)
 
+        # Configure recorder
+        VideoRecorderPipeline.configure_recorder(self.graph["sink"], config["sink"])
+
+    @staticmethod
+    def configure_recorder(sink, params):
+        '''
+        Configures splitmuxsink from the parameters: segment_duration, time_to_keep_days, location
+        '''
         # Configure video segment size
-        if config.isSet("sink.segment_duration"):
-            segment_duration = config.get("sink.segment_duration")
+        if params.get("segment_duration") is not None:
+            segment_duration = params.get("segment_duration")
             segment_duration = segment_duration.split(':')
             segment_duration_hour = int(segment_duration[0])
             segment_duration_min = int(segment_duration[1])
@@ -45,25 +53,25 @@ class VideoRecorderPipeline(StreamPipeline):
             segment_duration_total_sec = segment_duration_sec + 60 * (segment_duration_min + 60 * segment_duration_hour)
             logger.info("segment_duration_total_sec: %d" % segment_duration_total_sec)
             segment_duration_total_ns = 1000000000 * segment_duration_total_sec
-            self.graph["sink"].set_property("max-size-time", segment_duration_total_ns)
+            sink.set_property("max-size-time", segment_duration_total_ns)
 
         # Configure time-to-live for a video segment
-        if config.isSet("sink.time_to_keep_days"):
-            time_to_keep_days = config.get("sink.time_to_keep_days")
+        if params.get("time_to_keep_days") is not None:
+            time_to_keep_days = params.get("time_to_keep_days")
             time_to_keep_sec = time_to_keep_days * 24 * 60 * 60
             max_files = int(float(time_to_keep_sec) / float(segment_duration_total_sec))
             logger.info("time_to_keep_sec: %d" % time_to_keep_sec)
             logger.info("max_files: %d" % max_files)
-            self.graph["sink"].set_property("max-files", max_files)
+            sink.set_property("max-files", max_files)
 
         # Configure muxer
-        if not config.isSet("sink.muxer-factory"):
+        if params.get("muxer-factory") is None:
             mux = Gst.ElementFactory.make("qtmux", "mux")
             mux.set_property("faststart", True)
-            self.graph["sink"].set_property("muxer", mux)
+            sink.set_property("muxer", mux)
 
         # Create desitnation folder
-        dest_dir = os.path.dirname(config.get("sink.location"))
+        dest_dir = os.path.dirname(params.get("location"))
         if dest_dir.strip() != "":
             logger.info("Destination directory: %s" % dest_dir)
             os.makedirs(dest_dir, mode=0o777, exist_ok=True)
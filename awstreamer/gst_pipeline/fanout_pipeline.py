@@ -0,0 +1,143 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+from .stream_pipeline import StreamPipeline
+from .stream_graph import Probe
+from .video_pipeline import VideoPipeline
+from .dvr_pipeline import VideoRecorderPipeline
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class FanOutPipeline(StreamPipeline):
+    '''
+    Single camera connection shared by recording, streaming and analytics:
+
+    source ~> depay -> parse -> tee -> record_queue -> record_parse -> record (splitmuxsink)
+                                    -> stream_queue -> stream_parse [-> stream_mux] -> stream (kvssink/hlssink)
+                                    -> analyse_queue -> decoder -> rate -> scale -> convert -> analyse_filter -> analyse (appsink)
+
+    Encoded stream is recorded and streamed without re-encoding, it's decoded once for the analytics branch,
+    which is downscaled and rate-limited. Branches are enabled by the "record", "stream" and "analyse" config sections.
+    '''
+
+    # Encoded data buffered for the decoder, older data is dropped instead of blocking other branches
+    ANALYSE_QUEUE_TIME = 2 * Gst.SECOND
+
+    # Parameters of the analyse section passed to the callback probe, "fps" is applied by the videorate instead
+    ANALYSE_PROBE_PARAMS = ["callback", "zero_copy", "every_n", "keyframes_only", "motion_threshold",
+                            "executor", "workers", "queue_size", "drop_policy", "late_ms"]
+
+    def __init__(self, config):
+        logger.info("Initializing %s..." % self.__class__.__name__)
+        super().__init__(config)
+
+    def build(self, config):
+        logger.info("Building %s..." % self.__class__.__name__)
+
+        # Source, encoded to H.264 unless it is already
+        VideoPipeline.add_source(self.graph, config)
+        if not self.graph.contains("parse"):
+            self.graph.add("h264parse", "parse")
+        self.graph.add("tee", "tee")
+        self.graph.add_links([" -> ".join(list(self.graph.keys()))])
+
+        # Recording branch
+        if config.isSet("record"):
+            self.graph.add_pipeline({
+                "record_queue": "queue",
+                "record_parse": "h264parse",
+                "record": "splitmuxsink"
+            })
+            self.graph.add_links(["tee.src_%u -> record_queue -> record_parse -> record.video"])
+
+        # Streaming branch
+        if config.isSet("stream"):
+            self.graph.add_pipeline({
+                "stream_queue": "queue",
+                "stream_parse": "h264parse"
+            })
+            if config.get("stream.name") == "hlssink":
+                self.graph.add("mpegtsmux", "stream_mux")
+                self.graph.add("hlssink", "stream")
+                self.graph.add_links(["tee.src_%u -> stream_queue -> stream_parse -> stream_mux -> stream"])
+            else:
+                self.graph.add(config.get("stream.name") if config.isSet("stream.name") else "kvssink", "stream")
+                self.graph.add_links(["tee.src_%u -> stream_queue -> stream_parse -> stream"])
+
+        # Analytics branch
+        if config.isSet("analyse"):
+            self.graph.add_pipeline({
+                "analyse_queue": "queue",
+                "decoder": "avdec_h264",
+                "rate": "videorate",
+                "scale": "videoscale",
+                "convert": "videoconvert",
+                "analyse_filter": "capsfilter",
+                "analyse": "appsink"
+            })
+            self.graph.add_links(["tee.src_%u -> analyse_queue -> decoder -> rate -> scale -> convert -> analyse_filter -> analyse"])
+
+        if len(self.graph.successors("tee")) == 0:
+            raise Exception("At least one of the branches has to be configured: record, stream or analyse")
+
+    def configure(self, config):
+        logger.info("Configuring %s..." % self.__class__.__name__)
+
+        # Configure source pipeline
+        VideoPipeline.configure_source(self.graph, config, link_filesrc=True)
+
+        # Configure recording branch
+        if self.graph.contains("record"):
+            VideoRecorderPipeline.configure_recorder(self.graph["record"], config["record"])
+
+        # Configure streaming branch
+        if self.graph.contains("stream"):
+            VideoPipeline.configure_sink(self.graph, config, key="stream")
+
+        # Configure analytics branch
+        if self.graph.contains("analyse"):
+            queue = self.graph["analyse_queue"]
+            queue.set_property("leaky", 2)
+            queue.set_property("max-size-buffers", 0)
+            queue.set_property("max-size-bytes", 0)
+            queue.set_property("max-size-time", FanOutPipeline.ANALYSE_QUEUE_TIME)
+            self.graph["rate"].set_property("drop-only", True)
+
+            img_format = config.get("analyse.img_format") if config.isSet("analyse.img_format") else "BGR"
+            caps_str = "video/x-raw,format=%s" % img_format
+            if config.isSet("analyse.width") and config.isSet("analyse.height"):
+                caps_str += ",width=%d,height=%d" % (config.get("analyse.width"), config.get("analyse.height"))
+            if config.isSet("analyse.fps"):
+                caps_str += ",framerate=%d/1" % config.get("analyse.fps")
+            config["analyse_filter"] = { "caps": caps_str }
+            self.graph["analyse_filter"].set_property("caps", Gst.caps_from_string(caps_str))
+
+            sink = self.graph["analyse"]
+            sink.set_property("sync", False)
+            sink.set_property("drop", True)
+            sink.set_property("max-buffers", 1)
+
+            # Frames are passed to the callback, as with buffer probes
+            if config.isSet("analyse.callback"):
+                params = {k: v for k,v in config["analyse"].items() if k in FanOutPipeline.ANALYSE_PROBE_PARAMS}
+                self.analyse_probe = Probe.from_config(params)
+                self.graph.probes["analyse.sink"] = self.analyse_probe
+                sink.set_property("emit-signals", True)
+                sink.connect("new-sample", self.on_new_sample)
+
+    def on_new_sample(self, sink):
+        '''
+        Callback function called on new frame of the analytics branch
+        '''
+        sample = sink.emit("pull-sample")
+        if sample is None:
+            return Gst.FlowReturn.OK
+
+        self.call_probe(self.analyse_probe, sample.get_buffer(), sample.get_caps())
+
+        return Gst.FlowReturn.OK
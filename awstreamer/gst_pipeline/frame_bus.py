@@ -0,0 +1,189 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import logging
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class FrameBus():
+    '''
+    Ring of frames in named shared memory, written by a single publisher and read by
+    any number of subscribers in other processes.
+
+    Memory layout (int64 words, data slots aligned to 64 bytes):
+        header: magic, number of slots, slot size, sequence number of the latest frame
+        slot headers: sequence number (-1 while being written), pts, size
+        slots: frame data
+
+    Ordering: publisher marks the slot as being written (-1), copies the data, then stores the sequence number;
+    readers check the sequence number before reading the slot and again after copying it (is_valid).
+    Header words are aligned int64 written with single stores, and there are no explicit memory fences:
+    this relies on stores becoming visible in program order, as on x86. On weakly ordered CPUs (e.g. ARM)
+    a reader may in rare cases miss a concurrent overwrite of the slot it is copying.
+    '''
+
+    MAGIC = 0x4157534652414D45
+    HEADER_WORDS = 4
+    SLOT_HEADER_WORDS = 3
+    ALIGNMENT = 64
+
+    def __init__(self, name, slots=0, slot_size=0, create=False):
+        self.name = name
+        self.create = create
+
+        if create:
+            header_size = FrameBus.get_header_size(slots)
+            self.shm = SharedMemory(name=name, create=True, size=header_size + slots * slot_size)
+        else:
+            self.shm = SharedMemory(name=name)
+            # Resource tracker would unlink the memory when subscriber exits, it's owned by the publisher
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        self.header = np.ndarray(FrameBus.HEADER_WORDS, dtype=np.int64, buffer=self.shm.buf)
+        if create:
+            self.header[:] = (FrameBus.MAGIC, slots, slot_size, -1)
+        elif self.header[0] != FrameBus.MAGIC:
+            raise Exception("Shared memory '%s' is not a frame bus" % name)
+
+        self.slots, self.slot_size = int(self.header[1]), int(self.header[2])
+        self.slot_headers = np.ndarray((self.slots, FrameBus.SLOT_HEADER_WORDS), dtype=np.int64,
+                                       buffer=self.shm.buf, offset=FrameBus.HEADER_WORDS * 8)
+        self.data = np.ndarray((self.slots, self.slot_size), dtype=np.uint8,
+                               buffer=self.shm.buf, offset=FrameBus.get_header_size(self.slots))
+        if create:
+            self.slot_headers[:, 0] = -1
+
+    @staticmethod
+    def get_header_size(slots):
+        size = 8 * (FrameBus.HEADER_WORDS + slots * FrameBus.SLOT_HEADER_WORDS)
+        return -(-size // FrameBus.ALIGNMENT) * FrameBus.ALIGNMENT
+
+    @staticmethod
+    def create_or_replace(name, slots, slot_size):
+        '''
+        Creates frame bus, taking over a stale one left behind by a publisher which hasn't closed it (e.g. crashed):
+        it's reattached to if it has the same number and size of slots, otherwise it's unlinked and created again
+        '''
+        try:
+            return FrameBus(name, slots, slot_size, create=True)
+        except FileExistsError:
+            pass
+
+        try:
+            stale = FrameBus(name)
+        except Exception as e:
+            logger.warning("Shared memory '%s' is not a usable frame bus: %s" % (name, repr(e)))
+            stale = None
+
+        if stale is not None and stale.slots == slots and stale.slot_size == slot_size:
+            logger.warning("Reattaching to stale frame bus '%s'" % name)
+            stale.create = True
+            resource_tracker.register(stale.shm._name, "shared_memory")
+            return stale
+        if stale is not None:
+            stale.close()
+
+        logger.warning("Replacing stale frame bus '%s'" % name)
+        shm = SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+        return FrameBus(name, slots, slot_size, create=True)
+
+    @staticmethod
+    def open(name, timeout=None, poll_interval=0.1):
+        '''
+        Opens frame bus created by a publisher, waits for it to appear
+        '''
+        start = time.time()
+        while True:
+            try:
+                return FrameBus(name)
+            except FileNotFoundError:
+                if timeout is not None and time.time() - start > timeout:
+                    raise
+                time.sleep(poll_interval)
+
+    def latest(self):
+        return int(self.header[3])
+
+    def publish(self, data, pts=-1):
+        '''
+        Copies frame (bytes-like uint8 ndarray) to the next slot
+        '''
+        seq = self.latest() + 1
+        slot = seq % self.slots
+        size = len(data)
+        if size > self.slot_size:
+            raise Exception("Frame of %d bytes does not fit into the slot of %d bytes" % (size, self.slot_size))
+
+        self.slot_headers[slot, 0] = -1
+        self.data[slot, :size] = data
+        self.slot_headers[slot, 1] = pts
+        self.slot_headers[slot, 2] = size
+        self.slot_headers[slot, 0] = seq
+        self.header[3] = seq
+        return seq
+
+    def is_valid(self, seq):
+        '''
+        Checks that the frame hasn't been overwritten, call it after the frame has been copied or used
+        '''
+        return self.slot_headers[seq % self.slots, 0] == seq
+
+    def get(self, seq):
+        '''
+        Returns (pts, view) of the frame with a given sequence number without copying,
+        or None if it has been overwritten. View is valid as long as is_valid(seq).
+        '''
+        slot = seq % self.slots
+        if self.slot_headers[slot, 0] != seq:
+            return None
+        pts, size = int(self.slot_headers[slot, 1]), int(self.slot_headers[slot, 2])
+        return pts, self.data[slot, :size]
+
+    def close(self):
+        del self.header, self.slot_headers, self.data
+        self.shm.close()
+        if self.create:
+            self.shm.unlink()
+
+class FrameBusSubscriber():
+    '''
+    Reads frames from the frame bus in order. Subscriber falling behind by more than
+    the ring size skips to the latest frame, counting the skipped ones as dropped.
+    '''
+    def __init__(self, bus, poll_interval=0.002):
+        self.bus = bus
+        self.poll_interval = poll_interval
+        self.next_seq = max(bus.latest(), 0)
+        self.dropped = 0
+
+    def next(self, timeout=None):
+        '''
+        Returns (seq, pts, view) of the next frame or None on timeout
+        '''
+        start = time.time()
+        while True:
+            latest = self.bus.latest()
+            if latest >= self.next_seq:
+                # Publisher has lapped us, jump to the latest frame
+                if latest - self.next_seq >= self.bus.slots - 1:
+                    self.dropped += latest - self.next_seq
+                    self.next_seq = latest
+
+                seq = self.next_seq
+                self.next_seq += 1
+                frame = self.bus.get(seq)
+                if frame is None:
+                    self.dropped += 1
+                    continue
+                return (seq,) + frame
+
+            if timeout is not None and time.time() - start > timeout:
+                return None
+            time.sleep(self.poll_interval)
@@ -0,0 +1,157 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import logging
+from threading import Thread
+import cv2
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from .stream_pipeline import StreamPipeline
+from .stream_config import StreamConfig
+from ..utils.gst import VideoLayoutCache, gst_buffer_with_layout_to_mapped_ndarray, gst_buffer_with_layout_to_ndarray
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class GstCapture():
+    '''
+    cv2.VideoCapture-like source decoding with GStreamer:
+    uridecodebin ! videoconvert ! capsfilter ! appsink
+
+    Frames are returned as writable copies, like cv2.VideoCapture, or, with zero_copy=True (opt-in),
+    as read-only ndarrays backed by the decoded buffers, which can't be drawn on in place.
+    '''
+    def __init__(self, name, img_format="BGR", threads=0, drop=False, max_buffers=2, zero_copy=False):
+        self.uri = GstCapture.get_uri(name)
+        self.img_format = img_format
+        self.threads = threads
+        self.drop = drop
+        self.max_buffers = max_buffers
+        self.zero_copy = zero_copy
+        self.layouts = VideoLayoutCache()
+        self.open()
+
+    @staticmethod
+    def get_uri(name):
+        '''
+        Returns URI for camera index, file path or URI
+        '''
+        if isinstance(name, int):
+            return "v4l2:///dev/video%d" % name
+        if "://" in name:
+            return name
+        return Gst.filename_to_uri(os.path.abspath(name))
+
+    @staticmethod
+    def on_deep_element_added(bin, sub_bin, element, threads):
+        '''
+        Sets number of threads of decoders created by uridecodebin
+        '''
+        for prop in ["max-threads", "n-threads"]:
+            if element.find_property(prop) is not None:
+                logger.info("Setting property '%s' for plugin '%s' to a value: %d" % (prop, element.get_name(), threads))
+                element.set_property(prop, threads)
+
+    def open(self):
+        '''
+        Builds and starts the decoding pipeline
+        '''
+        config = {
+            "id": "capture",
+            "pipeline": {
+                "source": "uridecodebin",
+                "convert": "videoconvert",
+                "convert_filter": "capsfilter",
+                "sink": "appsink"
+            },
+            "source": {
+                "uri": self.uri,
+                "linkable": False
+            },
+            "convert_filter": {
+                "caps": "video/x-raw,format=%s" % self.img_format
+            },
+            "sink": {
+                "drop": self.drop,
+                "max-buffers": self.max_buffers,
+                "sync": False
+            }
+        }
+        if self.threads > 0:
+            config["source"]["signals"] = {
+                "deep-element-added": [GstCapture.on_deep_element_added, self.threads]
+            }
+            config["convert"] = { "n-threads": self.threads }
+
+        self.pipeline = StreamPipeline(StreamConfig(config))
+        self.sink = self.pipeline.get("sink")
+        self.thread = Thread(target=self.pipeline.start, daemon=True)
+        self.thread.start()
+
+    def isOpened(self):
+        return self.thread.is_alive()
+
+    def read(self):
+        '''
+        Returns (True, frame) or (False, None) on end of stream or error
+        '''
+        sample = self.sink.emit("pull-sample")
+        if sample is None:
+            return False, None
+
+        layout = self.layouts.get(sample.get_caps())
+        if self.zero_copy:
+            return True, gst_buffer_with_layout_to_mapped_ndarray(sample.get_buffer(), layout)
+        return True, gst_buffer_with_layout_to_ndarray(sample.get_buffer(), layout, do_copy=True)
+
+    def grab(self):
+        '''
+        Skips a frame
+        '''
+        return self.sink.emit("pull-sample") is not None
+
+    def get_fps(self):
+        caps = self.sink.get_static_pad("sink").get_current_caps()
+        if caps is None:
+            return 0
+        ok, num, den = caps.get_structure(0).get_fraction("framerate")
+        return float(num) / den if ok and den > 0 else 0
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.get_fps()
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            ok, position = self.pipeline.pipeline.query_position(Gst.Format.TIME)
+            return position * self.get_fps() / Gst.SECOND if ok else 0
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            ok, duration = self.pipeline.pipeline.query_duration(Gst.Format.TIME)
+            return duration * self.get_fps() / Gst.SECOND if ok else 0
+        return 0
+
+    def set(self, prop, value):
+        '''
+        Supports seeking with cv2.CAP_PROP_POS_FRAMES, restarts the pipeline after end of stream
+        '''
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+
+        if not self.isOpened():
+            self.open()
+
+        # Wait for preroll to know the framerate
+        self.pipeline.pipeline.get_state(Gst.CLOCK_TIME_NONE)
+        fps = self.get_fps()
+        if fps <= 0:
+            return False
+
+        position = int(value * Gst.SECOND / fps)
+        return self.pipeline.pipeline.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE, position)
+
+    def release(self):
+        self.pipeline.pipeline.send_event(Gst.Event.new_eos())
+        self.pipeline.loop.quit()
+        self.thread.join()
@@ -54,10 +54,13 @@ class PipelineFactory():
         d = {
             "default": ".stream_pipeline.StreamPipeline",
             "dvr": ".dvr_pipeline.VideoRecorderPipeline",
+            "fanout": ".fanout_pipeline.FanOutPipeline",
             "video": ".video_pipeline.VideoPipeline",
             "deepstream": ".ds_pipeline.DeepStreamPipeline",
             "appsrc": ".appsrc_pipeline.AppSrcPipeline",
             "cv": ".cv_pipeline.OpenCvPipeline",
+            "bus_sink": ".bus_sink_pipeline.FrameBusSinkPipeline",
+            "bus_src": ".bus_src_pipeline.FrameBusSrcPipeline",
             "cmd": ".cmd_pipeline.CommandLinePipeline"
         }
 
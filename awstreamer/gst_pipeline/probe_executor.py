@@ -0,0 +1,105 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import logging
+from collections import deque
+from threading import Lock
+from pebble import ThreadPool, ProcessPool
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+def run_callback(callback, data, submitted):
+    '''
+    Runs probe callback in the executor, returns how long it has been waiting (sec)
+    '''
+    waited = time.time() - submitted
+    callback(data)
+    return waited
+
+class ProbeExecutor():
+    '''
+    Runs probe callbacks off the streaming thread, in a thread or process pool.
+    At most workers + queue_size callbacks are in flight, on overflow the drop policy decides which frame is dropped:
+        drop-newest: the frame being dispatched
+        drop-oldest: the oldest frame still waiting in the queue
+    Callbacks which have waited longer than late_ms are counted as late.
+    '''
+
+    POLICIES = ["drop-newest", "drop-oldest"]
+
+    def __init__(self, executor="thread", workers=1, queue_size=2, drop_policy="drop-oldest", late_ms=100):
+        if executor not in ["thread", "process"]:
+            raise Exception("Unknown executor '%s', expected 'thread' or 'process'" % executor)
+        if drop_policy not in ProbeExecutor.POLICIES:
+            raise Exception("Unknown drop policy '%s', expected one of: %s" % (drop_policy, ProbeExecutor.POLICIES))
+
+        self.pool = ThreadPool(max_workers=workers) if executor == "thread" else ProcessPool(max_workers=workers)
+        self.capacity = workers + queue_size
+        self.drop_policy = drop_policy
+        self.late_ms = late_ms
+        self.pending = deque()
+        self.lock = Lock()
+
+        self.dispatched = 0
+        self.dropped = 0
+        self.late = 0
+        self.failed = 0
+
+    def submit(self, callback, data):
+        '''
+        Dispatches callback with data to the pool, returns False if the frame has been dropped
+        '''
+        with self.lock:
+            self.pending = deque(f for f in self.pending if not f.done())
+
+            if len(self.pending) >= self.capacity:
+                self.dropped += 1
+                if self.drop_policy == "drop-newest":
+                    return False
+
+                # Cancel the oldest callback which hasn't started yet
+                waiting = [f for f in self.pending if not f.running()]
+                if len(waiting) == 0 or not waiting[0].cancel():
+                    return False
+                self.pending.remove(waiting[0])
+
+            future = self.pool.schedule(run_callback, args=[callback, data, time.time()])
+            future.add_done_callback(self.on_done)
+            self.pending.append(future)
+            self.dispatched += 1
+            return True
+
+    def on_done(self, future):
+        '''
+        Callback function called on finished callback
+        '''
+        if future.cancelled():
+            return
+        try:
+            waited = future.result()
+            if waited * 1000 > self.late_ms:
+                with self.lock:
+                    self.late += 1
+        except Exception as e:
+            logger.error("Probe callback raised: " + repr(e))
+            with self.lock:
+                self.failed += 1
+
+    def get_stats(self):
+        '''
+        Returns dispatch statistics
+        '''
+        with self.lock:
+            return {
+                "dispatched": self.dispatched,
+                "dropped": self.dropped,
+                "late": self.late,
+                "failed": self.failed,
+                "queued": sum(1 for f in self.pending if not f.done())
+            }
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
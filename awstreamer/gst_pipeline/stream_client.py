@@ -7,11 +7,16 @@
 import os
 import sys
 import time
+import random
 import argparse
 import logging
+from collections import deque
+from multiprocessing import Manager
 from pprint import pformat
+from queue import Empty
+from concurrent.futures import CancelledError
 from pebble import ProcessPool
-from threading import Thread
+from threading import Thread, Timer, RLock
 
 from .stream_config import StreamConfig
 from .pipeline_factory import PipelineFactory
@@ -27,7 +32,31 @@ logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
-def stream_pipeline(id, params):
+def listen(channel, pipeline):
+    '''
+    Applies config changes received from StreamClient to the running pipeline, in its main loop.
+    Replies whether the changes have been applied live.
+    '''
+    requests, replies = channel
+
+    def apply(changes):
+        try:
+            replies.put(pipeline.reconfigure(changes))
+        except Exception as e:
+            logger.error("Failed to reconfigure pipeline: " + repr(e))
+            replies.put(False)
+        return False
+
+    while True:
+        try:
+            changes = requests.get()
+        except (EOFError, OSError):
+            break
+        if changes is None:
+            break
+        GLib.idle_add(apply, changes)
+
+def stream_pipeline(id, params, channel=None):
     '''
     Creates and starts a new GStreamer pipeline.
     This cannot be a member of a StreamClient to conform with Python3.6 limitations.
@@ -41,6 +70,10 @@ def stream_pipeline(id, params):
         # Get pipeline
         pipeline = PipelineFactory.createPipeline(config)
 
+        # Listen for config changes
+        if channel is not None:
+            Thread(target=listen, args=(channel, pipeline), daemon=True).start()
+
         # Start pipeline
         pipeline.start()
 
@@ -48,6 +81,102 @@ def stream_pipeline(id, params):
         logger.error("Failed to run StreamPipeline: " + repr(e))
         raise e
 
+    # Runtime error ends the main loop, report it for restart
+    error = getattr(pipeline, "error", None)
+    if error is not None:
+        raise Exception(error)
+
+class SharedMainLoop():
+    '''
+    Handle to the main loop shared by pipelines of one worker process, passed to StreamPipeline.start().
+    Pipeline quitting its handle (on EOS or error) is stopped alone, the loop runs until all pipelines have quit,
+    or until the worker is cancelled if it is kept alive for restarted pipelines.
+    Finished pipeline is reported to StreamClient as (id, error or None on end of stream) through events queue.
+    '''
+    def __init__(self, loop, running, id, events=None, keep_alive=False):
+        self.loop = loop
+        self.running = running
+        self.id = id
+        self.events = events
+        self.keep_alive = keep_alive
+        self.pipeline = None
+
+    def quit(self):
+        error = getattr(self.pipeline, "error", None)
+        logger.info("Pipeline %s has finished%s" % (self.id, "" if error is None else ": " + error))
+        if self.pipeline is not None:
+            self.pipeline.pipeline.set_state(Gst.State.NULL)
+        if self.events is not None and self.id in self.running:
+            try:
+                self.events.put((self.id, error))
+            except Exception as e:
+                logger.error("Failed to report pipeline %s: %s" % (self.id, repr(e)))
+        self.running.discard(self.id)
+        if len(self.running) == 0 and not self.keep_alive:
+            self.loop.quit()
+
+def receive(control, start):
+    '''
+    Starts pipelines restarted by StreamClient inside the running worker, in its main loop
+    '''
+    while True:
+        try:
+            request = control.get()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        GLib.idle_add(start, *request)
+
+def stream_pipelines(group, channels=dict(), events=None, control=None):
+    '''
+    Creates GStreamer pipelines from a dictionary {id: params} and runs them in a single main loop.
+    Pipeline failing to start doesn't affect the others, pipelines finishing while the others keep running
+    are reported through events queue.
+    With control queue the worker is kept alive until cancelled, starting pipelines (id, params, channel)
+    restarted by StreamClient; pipelines failing to start are reported through events queue then.
+    Returns dictionary {id: None on success or error string}.
+    '''
+    loop = GLib.MainLoop()
+    running = set()
+    status = dict()
+
+    def start(id, params, channel=None):
+        handle = SharedMainLoop(loop, running, id, events, control is not None)
+        try:
+            # Update config
+            params["id"] = id
+            config = StreamConfig(params)
+            logger.info(pformat(config))
+
+            # Get pipeline and start it in the shared loop
+            handle.pipeline = PipelineFactory.createPipeline(config)
+            if channel is not None:
+                Thread(target=listen, args=(channel, handle.pipeline), daemon=True).start()
+            running.add(id)
+            handle.pipeline.start(handle)
+            status[id] = None
+
+        except Exception as e:
+            logger.error("Failed to run StreamPipeline %s: %s" % (id, repr(e)))
+            running.discard(id)
+            status[id] = repr(e)
+            if control is not None:
+                events.put((id, repr(e)))
+        return False
+
+    for id, params in group.items():
+        start(id, params, channels.get(id))
+
+    if control is not None:
+        Thread(target=receive, args=(control, start), daemon=True).start()
+
+    # Run the main loop until all pipelines have finished
+    if len(running) > 0 or control is not None:
+        loop.run()
+
+    return status
+
 class StreamClient():
     '''
     Client managing all stream pipelines
@@ -56,10 +185,54 @@ class StreamClient():
     # Maximum number of cameras that can be configured
     MAX_PIPELINE_COUNT = 20
 
-    def __init__(self):
+    # Pipelines which run their own loop and always get a dedicated worker process
+    SOLO_PIPELINES = ["cv", "cmd"]
+
+    # Restart delay (sec) doubles with every restart within the window, up to the maximum
+    RESTART_DELAY = 1
+    RESTART_DELAY_MAX = 60
+
+    # Pipeline failing more than RESTART_BUDGET times within RESTART_WINDOW (sec) is not restarted anymore
+    RESTART_BUDGET = 5
+    RESTART_WINDOW = 600
+
+    # Changes of these element parameters always restart the pipeline
+    RESTART_PARAMS = ["name", "enabled", "linkable", "signals", "probes"]
+
+    # Config keys maintained by the client, not compared when diffing configs
+    IGNORED_KEYS = ["id"]
+
+    # Seconds to wait for the worker to apply config changes, before restarting the pipeline instead
+    RECONFIGURE_TIMEOUT = 5
+
+    def __init__(self, pipelines_per_worker=1, workers=None):
+        '''
+        With pipelines_per_worker = 1 every pipeline runs in its own process (up to MAX_PIPELINE_COUNT).
+        Otherwise pipelines scheduled together are packed up to pipelines_per_worker into processes
+        sharing one main loop, with number of workers defaulting to number of CPU cores.
+        '''
+        self.pipelines_per_worker = max(1, pipelines_per_worker)
+        if self.pipelines_per_worker == 1:
+            self.workers = StreamClient.MAX_PIPELINE_COUNT + 1
+            self.max_pipeline_count = StreamClient.MAX_PIPELINE_COUNT
+        else:
+            self.workers = workers if workers is not None else (os.cpu_count() or 1)
+            self.max_pipeline_count = self.workers * self.pipelines_per_worker
+        logger.info("Workers: %d, pipelines per worker: %d" % (self.workers, self.pipelines_per_worker))
+
         # Initialize concurrent engine
-        self.pool = ProcessPool(max_workers=StreamClient.MAX_PIPELINE_COUNT+1, max_tasks=StreamClient.MAX_PIPELINE_COUNT)
+        self.pool = ProcessPool(max_workers=self.workers, max_tasks=StreamClient.MAX_PIPELINE_COUNT)
         self.futures = dict()
+        self.restarts = dict()
+        self.restart_on_exception = dict()
+        self.health = dict()
+        self.manager = None
+        self.channels = dict()
+        self.controls = dict()
+        self.events = None
+
+        # Guards futures, config, restarts and health, changed from timer and done-callback threads too
+        self.lock = RLock()
         self.set_env_variables()
         self.config = dict()
         self.pipelines = dict()
@@ -204,54 +377,186 @@ class StreamClient():
     def stop(self):
         self.pool.stop()
 
+    def pack(self, keys):
+        '''
+        Splits pipeline keys into groups sharing one worker process
+        '''
+        groups = []
+        group = []
+        for key in keys:
+            if self.is_solo(key):
+                groups.append([key])
+                continue
+            group.append(key)
+            if len(group) == self.pipelines_per_worker:
+                groups.append(group)
+                group = []
+        if len(group) > 0:
+            groups.append(group)
+        return groups
+
+    def is_solo(self, key):
+        '''
+        Returns True if the pipeline runs its own loop and gets a dedicated worker process
+        '''
+        pipeline = self.config[key].get("pipeline")
+        return isinstance(pipeline, str) and pipeline.lower() in StreamClient.SOLO_PIPELINES
+
+    def count_workers(self):
+        '''
+        Returns number of workers taken by scheduled pipelines, including queued ones
+        '''
+        return len(set(f for f in self.futures.values() if not f.done()))
+
+    @staticmethod
+    def diff(old, new):
+        '''
+        Returns element property changes {element: {property: value}} between two pipeline configs,
+        or None if the pipeline has to be restarted
+        '''
+        if not isinstance(old, dict) or not isinstance(new, dict):
+            return None
+
+        changes = dict()
+        for k in set(old.keys()) | set(new.keys()):
+            if k in StreamClient.IGNORED_KEYS or old.get(k) == new.get(k):
+                continue
+            before, after = old.get(k), new.get(k)
+            if not isinstance(before, dict) or not isinstance(after, dict):
+                return None
+            if len(set(before.keys()) - set(after.keys())) > 0:
+                # Property can't be reset to its default
+                return None
+            for p, v in after.items():
+                if before.get(p) != v:
+                    if p in StreamClient.RESTART_PARAMS:
+                        return None
+                    changes.setdefault(k, dict())[p] = v
+        return changes
+
+    def reconfigure(self, key, changes):
+        '''
+        Sends property changes to the running pipeline, returns True if they have been applied live
+        '''
+        requests, replies = self.channels[key]
+        try:
+            requests.put(changes)
+            return replies.get(timeout=StreamClient.RECONFIGURE_TIMEOUT)
+        except Empty:
+            logger.warning("Pipeline %s did not respond to reconfiguration" % key)
+        except Exception as e:
+            logger.error("Failed to reconfigure pipeline %s: %s" % (key, repr(e)))
+        return False
+
+    def launch(self, keys, restart_on_exception=False):
+        '''
+        Schedules pipelines with given keys on the process pool
+        '''
+        # Channels for live reconfiguration, and for pipelines finishing inside shared workers
+        if self.manager is None:
+            self.manager = Manager()
+            self.events = self.manager.Queue()
+            Thread(target=self.watch_events, daemon=True).start()
+        for key in keys:
+            self.channels[key] = (self.manager.Queue(), self.manager.Queue())
+            self.restart_on_exception[key] = restart_on_exception
+
+        for group in self.pack(keys):
+            if self.pipelines_per_worker == 1:
+                future = self.pool.schedule(stream_pipeline, args=[group[0], self.config[group[0]], self.channels[group[0]]])
+            else:
+                control = self.manager.Queue()
+                future = self.pool.schedule(stream_pipelines, args=[{key: self.config[key] for key in group},
+                                                                    {key: self.channels[key] for key in group},
+                                                                    self.events, control])
+                self.controls[future] = control
+            for key in group:
+                self.futures[key] = future
+            if restart_on_exception:
+                future.add_done_callback(self.catch_and_restart)
+
     def schedule(self, config_or_filename=None, wait_for_finish=False, restart_on_exception=False):
         '''
         Start one or more pipelines asynchronously, in parallel
         '''
         try:
-            # Get config in the proper format
-            config = self.get_config(config_or_filename)
-
-            # Update cached config
-            self.update(config)
-
-            # Check for misuse of schedule()
-            for i in ['debug', 'enabled']:
-                if i in config and isinstance(config[i], bool):
-                    logger.error("Either use start() instead of schedule() or nest the configuration into a pipeline.")
-                    return config
-
-            # Stop pipelines that are going to be reconfigured
-            for key in self.futures:
-                if key in config:
-                    logger.info("Cancelling the following pipeline: %s" % key)
-                    if self.futures[key].cancel() == False:
-                        logger.error("Failed to cancel the following pipeline: %s" % key)
-                        continue
-
-            # Spin off each camera pipeline in a separate thread/process
-            for key in config:
-                # Cap at MAX_PIPELINE_COUNT
-                if len(self.futures.keys()) >= StreamClient.MAX_PIPELINE_COUNT:
-                    logger.error("Maximum number of pipelines reached. Not configuring %s" % key)
-                    continue
+            with self.lock:
+                # Get config in the proper format
+                config = self.get_config(config_or_filename)
+
+                # Update cached config
+                previous = dict(self.config)
+                self.update(config)
+
+                # Check for misuse of schedule()
+                for i in ['debug', 'enabled']:
+                    if i in config and isinstance(config[i], bool):
+                        logger.error("Either use start() instead of schedule() or nest the configuration into a pipeline.")
+                        return config
+
+                # Apply property changes to running pipelines live, where possible
+                keys = []
+                for key in config:
+                    if key in self.futures and not self.futures[key].done() and key in self.channels:
+                        changes = StreamClient.diff(previous.get(key), config[key])
+                        if changes is not None and (len(changes) == 0 or self.reconfigure(key, changes)):
+                            logger.info("Reconfigured pipeline %s live: %s" % (key, changes))
+                            continue
+                    keys.append(key)
+
+                # Stop pipelines that are going to be restarted, along with pipelines sharing their worker
+                for key in list(self.futures):
+                    # Pipelines sharing a worker with an earlier key have been removed with it already
+                    if key in keys and key in self.futures:
+                        logger.info("Cancelling the following pipeline: %s" % key)
+                        future = self.futures[key]
+                        if future.cancel() == False and not future.done():
+                            logger.error("Failed to cancel the following pipeline: %s" % key)
+                            continue
+                        self.controls.pop(future, None)
+                        for other in [k for k,v in self.futures.items() if v is future]:
+                            del self.futures[other]
+                            if other not in keys:
+                                keys.append(other)
 
                 # Skip those sources that are disabled in configuration
-                if "enabled" in config[key] and not config[key]["enabled"]:
-                    logger.info("Skipping %s (disabled)" % key)
-                    del self.config[key]
-                    continue
+                for key in list(keys):
+                    if "enabled" in self.config[key] and not self.config[key]["enabled"]:
+                        logger.info("Skipping %s (disabled)" % key)
+                        del self.config[key]
+                        keys.remove(key)
+
+                # Cap at max pipeline count
+                available = self.max_pipeline_count - len(self.futures)
+                for key in keys[max(0, available):]:
+                    logger.error("Maximum number of pipelines reached. Not configuring %s" % key)
+                keys = keys[:max(0, available)]
 
-                # Start new process/thread
-                future = self.pool.schedule(stream_pipeline, args=[key, config[key]])
-                if restart_on_exception:
-                    future.add_done_callback(self.catch_and_restart)
-                self.futures[key] = future
+                # Cap at number of free workers, queued groups would not run until another one finishes
+                groups = self.pack(keys)
+                available = self.workers - self.count_workers()
+                for key in [k for group in groups[max(0, available):] for k in group]:
+                    logger.error("No free worker left. Not configuring %s" % key)
+                keys = [k for group in groups[:max(0, available)] for k in group]
+
+                # Reconfigured pipelines get a new restart budget
+                for key in keys:
+                    self.restarts.pop(key, None)
+                    self.health.pop(key, None)
+
+                # Spin off pipelines in separate processes
+                self.launch(keys, restart_on_exception)
 
             # This is a blocking call, therefore use with caution (it will prevent parallel execution!)
             if wait_for_finish:
-                for key in self.futures:
-                    logger.info(self.futures[key].result())
+                with self.lock:
+                    futures = set(self.futures.values())
+                for future in futures:
+                    try:
+                        logger.info(future.result())
+                    except CancelledError:
+                        # Shared workers are cancelled once all their pipelines have finished
+                        pass
 
         except Exception as e:
             logger.error("Failed to start pipeline(s): " + repr(e))
@@ -261,13 +566,21 @@ class StreamClient():
 
     def catch_and_restart(self, future):
         '''
-        Catches any exception from the future and restarts the process/thread
+        Catches any exception from the future and restarts the failed pipeline(s) only
         '''
+        with self.lock:
+            keys = [k for k,v in self.futures.items() if v is future]
+        failed = dict()
         try:
             result = future.result()
             logger.info(result)
+
+            # Pipelines sharing a worker report their errors in the result
+            if isinstance(result, dict):
+                failed = {k: e for k,e in result.items() if e is not None and k in keys}
         except TimeoutError as error:
             logger.error("Function took longer than %d seconds" % error.args[1])
+            failed = {k: repr(error) for k in keys}
         except Exception as error:
             logger.error("Function raised %s" % error)
 
@@ -278,9 +591,155 @@ class StreamClient():
             if hasattr(error, 'traceback'):
                 logger.error(error.traceback)
 
-            logger.info("Restarting all pipelines after 5 sec...")
-            time.sleep(5)
-            self.schedule(self.config, wait_for_finish=False, restart_on_exception=True)
+            failed = {k: repr(error) for k in keys}
+
+        for key, error in failed.items():
+            self.schedule_restart(key, future, error)
+
+    def schedule_restart(self, key, future, error):
+        '''
+        Restarts the pipeline after exponential backoff with jitter, unless it has used up its restart budget
+        '''
+        with self.lock:
+            if key not in self.config:
+                return
+            self.health[key] = self.backoff(key, future, error)
+
+    def backoff(self, key, future, error):
+        '''
+        Schedules restart of the pipeline, returns its health: state, number of restarts and the last error
+        '''
+        # Restarts within the window
+        now = time.time()
+        history = self.restarts.setdefault(key, deque())
+        while len(history) > 0 and now - history[0] > StreamClient.RESTART_WINDOW:
+            history.popleft()
+
+        health = { "error": error, "restarts": len(history) }
+        if len(history) >= StreamClient.RESTART_BUDGET:
+            logger.error("Pipeline %s has failed %d times within %d sec, not restarting it anymore" \
+                % (key, len(history) + 1, StreamClient.RESTART_WINDOW))
+            health["state"] = "crash-loop"
+
+            # Pipeline is not running anymore, free its slot
+            if self.futures.get(key) is future:
+                del self.futures[key]
+                self.release(future)
+        else:
+            delay = min(StreamClient.RESTART_DELAY_MAX, StreamClient.RESTART_DELAY * 2 ** len(history))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            logger.info("Restarting pipeline %s after %.1f sec..." % (key, delay))
+            history.append(now)
+            health["state"] = "restarting"
+            health["restart_in"] = delay
+            Timer(delay, self.restart, args=[key, future]).start()
+
+        return health
+
+    def restart(self, key, future):
+        '''
+        Restarts single pipeline, unless it has been reconfigured or removed in the meantime.
+        Pipeline is restarted inside its shared worker if it is still running, or one with spare capacity.
+        Otherwise it gets a new worker, or waits for a free one.
+        '''
+        with self.lock:
+            if key not in self.config or self.futures.get(key) is not future:
+                return
+
+            worker = self.find_worker(key, future)
+            if worker is not None:
+                logger.info("Restarting pipeline %s in a running worker" % key)
+                self.channels[key][0].put(None)
+                self.channels[key] = (self.manager.Queue(), self.manager.Queue())
+                self.futures[key] = worker
+                self.controls[worker].put((key, self.config[key], self.channels[key]))
+                self.release(future)
+            elif self.count_workers() < self.workers:
+                del self.futures[key]
+                self.release(future)
+                self.launch([key], restart_on_exception=True)
+            else:
+                logger.warning("No free worker to restart pipeline %s, retrying..." % key)
+                self.health[key]["state"] = "pending"
+                Timer(StreamClient.RESTART_DELAY, self.restart, args=[key, future]).start()
+                return
+            self.health[key]["state"] = "running"
+
+    def find_worker(self, key, future):
+        '''
+        Returns running shared worker to restart the pipeline in: its own one, or another one with spare capacity
+        '''
+        if future in self.controls and not future.done():
+            return future
+        if self.is_solo(key):
+            return None
+        for worker in set(self.futures.values()):
+            keys = [k for k,v in self.futures.items() if v is worker]
+            if worker in self.controls and not worker.done() and len(keys) < self.pipelines_per_worker \
+                and not any(self.is_solo(k) for k in keys):
+                return worker
+        return None
+
+    def release(self, future):
+        '''
+        Cancels shared worker kept alive for restarted pipelines once none of its pipelines is left
+        '''
+        if any(v is future for v in self.futures.values()):
+            return
+        if self.controls.pop(future, None) is not None:
+            future.cancel()
+
+    def watch_events(self):
+        '''
+        Thread receiving pipelines which have finished inside shared workers while the others keep running:
+        failed ones are restarted alone, finished ones free their slot
+        '''
+        while True:
+            try:
+                key, error = self.events.get()
+            except (EOFError, OSError):
+                break
+
+            with self.lock:
+                future = self.futures.get(key)
+                if future is None:
+                    continue
+                if error is None:
+                    logger.info("Pipeline %s has reached end of stream" % key)
+                    del self.futures[key]
+                    self.release(future)
+                elif self.restart_on_exception.get(key):
+                    logger.error("Pipeline %s has failed: %s" % (key, error))
+                    self.schedule_restart(key, future, error)
+                else:
+                    logger.error("Pipeline %s has failed: %s" % (key, error))
+                    del self.futures[key]
+                    self.release(future)
+
+    def get_health(self, key=None):
+        '''
+        Returns health of scheduled and restarted pipelines {key: {state, restarts, error, restart_in}},
+        or of a single one. Pipeline waiting in the queue for a free worker is "pending".
+        '''
+        with self.lock:
+            if key is not None:
+                return self.get_pipeline_health(key)
+            return {k: self.get_pipeline_health(k) for k in set(self.futures) | set(self.health)}
+
+    def get_pipeline_health(self, key):
+        '''
+        Returns health of a single pipeline, None if it has never been scheduled
+        '''
+        future = self.futures.get(key)
+        if key in self.health:
+            health = dict(self.health[key])
+        elif future is not None:
+            health = { "state": "running", "restarts": 0 }
+        else:
+            return None
+        if health["state"] == "running" and future is not None and not future.running() and not future.done():
+            health["state"] = "pending"
+        return health
 
 if __name__ == "__main__":
     # Parse args
@@ -2,14 +2,20 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import re
+import time
 import logging
 from collections import OrderedDict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import GObject, Gst, GLib
 
+from .probe_executor import ProbeExecutor
+from ..utils.gst import VideoLayoutCache, map_gst_buffer_to_ndarray
+from ..utils.motion import MotionGate
+
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
@@ -21,10 +27,123 @@ class Vertex:
     linkable: bool = True
     enabled: bool = True
 
+@dataclass
+class Edge:
+    src: str = None
+    dst: str = None
+    src_pad: str = None
+    dst_pad: str = None
+
+    @staticmethod
+    def parse_node(node):
+        '''
+        Splits "name.pad" into (name, pad), pad is None if not given
+        '''
+        name, _, pad = node.strip().partition('.')
+        return name, pad if pad else None
+
+@dataclass
+class Probe:
+    callback: object = None
+    zero_copy: bool = False
+
+    # Sampling policy: keyframes only, every Nth frame, target fps and motion,
+    # all but motion are evaluated before the buffer is mapped
+    keyframes_only: bool = False
+    every_n: int = 0
+    fps: float = 0
+    motion_threshold: float = 0
+
+    # Asynchronous callbacks: "thread" or "process" executor, see ProbeExecutor.
+    # Zero-copy frames passed to threads keep the buffer mapped until released, processes get copies.
+    executor: str = None
+    workers: int = 1
+    queue_size: int = 2
+    drop_policy: str = "drop-oldest"
+    late_ms: float = 100
+
+    layouts: VideoLayoutCache = field(default_factory=VideoLayoutCache)
+    frames: int = 0
+    next_pts: int = None
+    motion: MotionGate = None
+    pool: ProbeExecutor = None
+
+    def __post_init__(self):
+        if self.motion_threshold > 0:
+            self.motion = MotionGate(self.motion_threshold)
+        if self.executor is not None:
+            self.pool = ProbeExecutor(self.executor, self.workers, self.queue_size, self.drop_policy, self.late_ms)
+
+    @staticmethod
+    def from_config(value):
+        '''
+        Creates probe from config: either callback function or dictionary, e.g.
+        { "callback": my_callback, "zero_copy": True, "fps": 2 }
+        '''
+        if isinstance(value, dict):
+            return Probe(**value)
+        return Probe(callback=value)
+
+    def accept(self, buffer):
+        '''
+        Checks buffer flags and timestamp against the sampling policy, without mapping it
+        '''
+        if self.keyframes_only and buffer.has_flags(Gst.BufferFlags.DELTA_UNIT):
+            return False
+
+        self.frames += 1
+        if self.every_n > 1 and (self.frames - 1) % self.every_n != 0:
+            return False
+
+        if self.fps > 0:
+            pts = buffer.pts if buffer.pts != Gst.CLOCK_TIME_NONE else time.monotonic_ns()
+            interval = int(Gst.SECOND / self.fps)
+            if self.next_pts is not None and pts < self.next_pts:
+                return False
+            # Keep the average rate, unless we are late by more than a frame
+            late = self.next_pts is None or pts - self.next_pts >= interval
+            self.next_pts = pts + interval if late else self.next_pts + interval
+
+        return True
+
+    def has_motion(self, data):
+        '''
+        Compares subsampled frame (first plane of planar formats) with the running average of previous ones
+        '''
+        return self.motion is None or self.motion.check(data)
+
+    @property
+    def sampling(self):
+        return self.keyframes_only or self.every_n > 1 or self.fps > 0 or self.motion_threshold > 0
+
+    def dispatch(self, data):
+        '''
+        Calls the callback, on the executor if configured
+        '''
+        if self.pool is not None:
+            self.pool.submit(self.callback, data)
+        else:
+            self.callback(data)
+
+    def get_stats(self):
+        '''
+        Returns number of frames seen and executor statistics
+        '''
+        stats = { "frames": self.frames }
+        if self.pool is not None:
+            stats.update(self.pool.get_stats())
+        return stats
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
 class StreamGraph():
     def __init__(self, *args, **kwargs):
         logger.info("Initializing StreamGraph...")
         self.vmap = OrderedDict()
+        self.edges = []
+        self.probes = dict()
         self.parse_launch = False
         self.callbacks = dict()
 
@@ -48,6 +167,66 @@ class StreamGraph():
         for k,v in pipeline.items():
             self.add(v, k)
 
+    def link(self, src, dst, src_pad=None, dst_pad=None):
+        '''
+        Adds explicit edge between elements, optionally between named pads. Pad names can be
+        pad templates of request pads (e.g. "src_%u" of tee or "sink_%u" of compositor).
+        Once the graph has explicit edges, only these are linked, not the insertion order.
+        '''
+        self.edges.append(Edge(src, dst, src_pad, dst_pad))
+
+    def add_links(self, links: list):
+        '''
+        Adds edges from chains, e.g. ["source -> tee", "tee.src_%u -> queue_0 -> mux.video", ...].
+        Pad can be given for the first and the last element of a chain.
+        '''
+        for chain in links:
+            nodes = chain.split("->")
+            for i in range(len(nodes) - 1):
+                src, src_pad = Edge.parse_node(nodes[i])
+                dst, dst_pad = Edge.parse_node(nodes[i+1])
+                if (src_pad is not None and i > 0) or (dst_pad is not None and i + 2 < len(nodes)):
+                    raise Exception("Pads can be given only at the ends of the chain: %s" % chain)
+                self.link(src, dst, src_pad, dst_pad)
+
+    def successors(self, key):
+        return [e.dst for e in self.edges if e.src == key]
+
+    def predecessors(self, key):
+        return [e.src for e in self.edges if e.dst == key]
+
+    def downstream(self, key):
+        '''
+        Returns key of the element the given one is linked to
+        '''
+        if len(self.edges) > 0:
+            successors = self.successors(key)
+            return successors[0] if len(successors) > 0 else None
+        return self.next_key(key)
+
+    def validate(self):
+        '''
+        Checks that explicit edges connect existing elements and form an acyclic graph
+        '''
+        for e in self.edges:
+            for k in [e.src, e.dst]:
+                if k not in self.vmap:
+                    raise Exception("Edge %s -> %s refers to unknown element: %s" % (e.src, e.dst, k))
+
+        # Kahn's algorithm: all vertices can be sorted topologically only if there is no cycle
+        indegree = {k: len(self.predecessors(k)) for k in self.keys()}
+        ready = [k for k,n in indegree.items() if n == 0]
+        visited = 0
+        while len(ready) > 0:
+            k = ready.pop()
+            visited += 1
+            for dst in self.successors(k):
+                indegree[dst] -= 1
+                if indegree[dst] == 0:
+                    ready.append(dst)
+        if visited != len(self.vmap):
+            raise Exception("Pipeline graph contains a cycle")
+
     def get(self, name):
         return self.vmap[name]
 
@@ -75,6 +254,46 @@ class StreamGraph():
     def __setitem__(self, key, value):
         self.vmap[key] = value
 
+    @staticmethod
+    def sampling_probe_callback(pad, info, probe):
+        '''
+        Callback function of the sampling probe: passes only sampled buffers
+        '''
+        gst_buffer = info.get_buffer()
+        if gst_buffer is None or not probe.sampling:
+            return Gst.PadProbeReturn.OK
+        if not probe.accept(gst_buffer):
+            return Gst.PadProbeReturn.DROP
+        if probe.motion_threshold > 0:
+            layout = probe.layouts.get(pad.get_current_caps())
+            with map_gst_buffer_to_ndarray(gst_buffer, layout) as data:
+                if not probe.has_motion(data):
+                    return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    @staticmethod
+    def get_pad(elem, name):
+        '''
+        Returns static pad or requests a new one, name can be pad template (e.g. "sink_%u")
+        '''
+        pad = elem.get_static_pad(name)
+        if pad is None:
+            request = elem.request_pad_simple if hasattr(elem, "request_pad_simple") else elem.get_request_pad
+            pad = request(name)
+        return pad
+
+    @staticmethod
+    def pad_matches(pad, name):
+        '''
+        Checks if the pad has a given name, or was created from a given pad template (e.g. "video_%u")
+        '''
+        if name is None or pad.get_name() == name:
+            return True
+        if "%" not in name:
+            return False
+        pattern = re.escape(name).replace("%u", r"\d+").replace("%d", r"-?\d+").replace("%s", ".+")
+        return re.fullmatch(pattern, pad.get_name()) is not None
+
     def compile(self, pipeline):
         '''
         Compiles the graph to the pipeline: adds elements from the graph and links them
@@ -87,6 +306,10 @@ class StreamGraph():
             logger.info("Adding: %s" % k)
             pipeline.add(v.elem)
 
+        if len(self.edges) > 0:
+            self.compile_edges()
+            return
+
         # Link elements
         prev = None
         graph_str = ""
@@ -111,6 +334,27 @@ class StreamGraph():
             graph_str += "%s [%s]" % (k, v.factory_name)
         logger.info(graph_str)
 
+    def compile_edges(self):
+        '''
+        Links elements along explicit edges
+        '''
+        self.validate()
+        for e in self.edges:
+            src, dst = self.get(e.src), self.get(e.dst)
+            if not src.enabled or not dst.enabled:
+                continue
+            edge_str = "%s%s -> %s%s" % (e.src, "." + e.src_pad if e.src_pad else "", e.dst, "." + e.dst_pad if e.dst_pad else "")
+
+            if not src.linkable:
+                # Sometimes pads: link when the pad appears
+                target = StreamGraph.get_pad(dst.elem, e.dst_pad) if e.dst_pad else dst.elem
+                logger.info("%s will be linked on new pad added" % edge_str)
+                src.elem.connect("pad-added", self.callbacks["on_pad_added"], target, e.src_pad)
+            elif not Gst.Element.link_pads(src.elem, e.src_pad, dst.elem, e.dst_pad):
+                raise Exception("Failed to link %s" % edge_str)
+            else:
+                logger.info("Linked %s" % edge_str)
+
     def configure(self, k, v):
         '''
         Configure plugin k with values from dictionary v
@@ -139,13 +383,23 @@ class StreamGraph():
             # Add probes
             if "probes" in v:
                 logger.info("probes:")
-                for pad_name, callback in v["probes"].items():
+                for pad_name, probe in v["probes"].items():
                     logger.info("Connecting buffer probe for plugin '%s' to the pad: %s" % (k, pad_name))
                     pad = plugin.get_static_pad(pad_name)
                     if not pad:
                         logger.error("Unable to get %s pad of %s\n" % (pad_name, k))
                     else:
-                        pad.add_probe(Gst.PadProbeType.BUFFER, self.callbacks["buffer_probe_callback"], callback)
+                        self.probes["%s.%s" % (k, pad_name)] = Probe.from_config(probe)
+                        pad.add_probe(Gst.PadProbeType.BUFFER, self.callbacks["buffer_probe_callback"], self.probes["%s.%s" % (k, pad_name)])
+
+            # Drop buffers not passing the sampling policy before they reach the plugin
+            if "sampling" in v:
+                logger.info("Adding sampling probe for plugin '%s': %s" % (k, v["sampling"]))
+                pad = plugin.get_static_pad("sink")
+                if not pad:
+                    logger.error("Unable to get sink pad of %s\n" % k)
+                else:
+                    pad.add_probe(Gst.PadProbeType.BUFFER, StreamGraph.sampling_probe_callback, Probe.from_config(v["sampling"]))
 
             # Set plug-in properties
             if plugin is not None:
@@ -161,10 +415,40 @@ class StreamGraph():
                         else:
                             plugin.set_property(p.name, v[p.name])
 
+    def get_params_str(self, k, config, parse_launch, named):
+        '''
+        Returns parameters of the plug-in k in gst-launch-1.0 format.
+        Named plug-ins (with name=k) take caps as a regular property.
+        '''
+        params_str = ""
+        plugin = self[k]
+        config_params = config[k] if k in config else {}
+
+        if plugin is None:
+            # For dummy plug-ins, we just assume that what's in config is going to the params,
+            # as there is no plug-in instance (yet), no cross-check
+            names = [p for p in config_params.keys() if not (named and p == "name")]
+        else:
+            names = [p.name for p in plugin.list_properties() if p.name != "name" and p.name in config_params]
+
+        for p in names:
+            prefix = " "
+            if p != "caps" or named:
+                prefix += p + "="
+            decorator = ""
+            if p == "caps":
+                # Caps property of named plug-ins is quoted for Gst.parse_launch() too, as caps may contain spaces and commas
+                decorator = "'" if not parse_launch else '"' if named else ""
+            params_str += prefix + decorator + str(config_params[p]) + decorator
+        return params_str
+
     def get_gst_launch_str(self, config=dict(), parse_launch=False):
         '''
         Returns gst-launch-1.0 string to use with command line or Gst.parse_launch()
         '''
+        if len(self.edges) > 0:
+            return self.get_gst_launch_dag_str(config, parse_launch)
+
         gst_launch_str = ""
         first = True
         tee = None
@@ -180,38 +464,28 @@ class StreamGraph():
             # Next plug-in
             if v.factory_name != "capsfilter":
                 gst_launch_str += v.factory_name
+            if v.factory_name == "tee" and self[k] is not None:
+                tee = self[k].get_property("name")
+                gst_launch_str += " name=" + tee
 
             # Plug-in's parameters
-            plugin = self[k]
-            config_params = config[k] if k in config else {}
-
-            if plugin is None:
-                # For dummy plug-ins, we just assume that what's in config is going to the params,
-                # as there is no plug-in instance (yet), no cross-check
-                for p,q in config_params.items():
-                    prefix = " "
-                    if p != "caps":
-                        prefix += p + "="
-                    decorator = "'" if not parse_launch and p == "caps" else ""
-                    gst_launch_str += prefix + decorator + str(q) + decorator
-            else:
-                props = plugin.list_properties()
-                for p in props:
-                    if p.name == "name":
-                        if v.factory_name == "tee":
-                            tee = plugin.get_property(p.name)
-                            gst_launch_str += " name=" + tee
-                        continue
-                    if p.name in config_params:
-                        prefix = " "
-                        if p.name != "caps":
-                            prefix += p.name + "="
-                        decorator = "'" if not parse_launch and p.name == "caps" else ""
-                        gst_launch_str += prefix + decorator + str(config_params[p.name]) + decorator
+            gst_launch_str += self.get_params_str(k, config, parse_launch, named=False)
 
             if v.linkable is None and tee is not None:
                 gst_launch_str += " %s." % tee
 
         return gst_launch_str.strip()
 
-
+    def get_gst_launch_dag_str(self, config=dict(), parse_launch=False):
+        '''
+        Returns gst-launch-1.0 string for graph with explicit edges:
+        named elements followed by links between them, e.g. "tee name=t ... t.src_%u ! mux.video"
+        '''
+        parts = []
+        for k,v in self.items():
+            if v.enabled:
+                parts.append("%s name=%s%s" % (v.factory_name, k, self.get_params_str(k, config, parse_launch, named=True)))
+        for e in self.edges:
+            if self.get(e.src).enabled and self.get(e.dst).enabled:
+                parts.append("%s.%s ! %s.%s" % (e.src, e.src_pad or "", e.dst, e.dst_pad or ""))
+        return " ".join(parts)
@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import time
 import logging
 from threading import Timer
 import datetime
@@ -16,7 +17,7 @@ from .stream_config import StreamConfig
 from .stream_graph import StreamGraph
 from ..utils.aws import get_aws_plugins_list, set_aws_env_variables
 from ..utils.plugin import get_python_plugins_list
-from ..utils.gst import gst_buffer_with_pad_to_ndarray
+from ..utils.gst import gst_buffer_with_layout_to_ndarray, gst_buffer_with_layout_to_mapped_ndarray, map_gst_buffer_to_ndarray
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -27,6 +28,13 @@ class StreamPipeline(object):
     '''
     Class for orchestrating camera inference pipeline
     '''
+
+    # Elements of the source bin rebuilt on RTSP reconnection, downstream elements keep playing
+    SOURCE_BIN = ["source", "depay", "parse"]
+
+    # Seconds without data from the source after which it is reconnected
+    DEFAULT_DATA_TIMEOUT = 5
+
     def __init__(self, config=None):
         logger.info("Initializing %s for %s.." % (self.__class__.__name__, config["id"]))
 
@@ -40,6 +48,16 @@ class StreamPipeline(object):
         self.loop = GLib.MainLoop()
         self.pipeline = None
         self.graph = StreamGraph()
+        self.stopping = False
+        self.error = None
+
+        # Source reconnection state
+        self.supervise_source = False
+        self.source_peer = None
+        self.source_watch_pad = None
+        self.last_buffer_time = None
+        self.reconnect_started = None
+        self.reconnect_times = []
 
         # Register callback functions
         self.graph.register_callback("on_pad_added", self.on_pad_added)
@@ -76,6 +94,10 @@ class StreamPipeline(object):
             logger.info("%s: %s" % (k,v))
             self.graph.add(v, k)
 
+        # Explicit links between elements, otherwise they are linked in order
+        if config.isSet("links"):
+            self.graph.add_links(config["links"])
+
     def configure(self, config):
         '''
         Virtual method, it can be overriden by a child
@@ -114,6 +136,32 @@ class StreamPipeline(object):
         gst_launch_str = self.graph.get_gst_launch_str(config, parse_launch=False)
         logger.info("gst-launch-1.0 " + gst_launch_str)
 
+    def reconfigure(self, changes):
+        '''
+        Applies property changes {element: {property: value}} to the running pipeline.
+        Returns False, without changing anything, if some of them can't be applied live.
+        Changed source bin of a supervised RTSP source is rebuilt with the new properties.
+        '''
+        if self.graph.parse_launch:
+            return False
+        for k, v in changes.items():
+            if not self.graph.contains(k) or self.graph[k] is None:
+                return False
+            for p in v:
+                if self.graph[k].find_property(p) is None:
+                    return False
+
+        source_bin = self.get_source_bin() if self.supervise_source else []
+        for k, v in changes.items():
+            logger.info("Reconfiguring plugin '%s': %s" % (k, v))
+            self.config[k] = StreamConfig.DeepUpdate(self.config.get(k), v)
+            if k not in source_bin:
+                self.graph.configure(k, v)
+
+        if any(k in source_bin for k in changes):
+            self.reconnect_source("reconfigured")
+        return True
+
     def on_message(self, bus, message, udata):
         '''
         Callback function called on pipeline message
@@ -126,14 +174,27 @@ class StreamPipeline(object):
             logger.warning(message.parse_warning())
         elif message.type == Gst.MessageType.ERROR:
             logger.error(message.parse_error())
+            if self.supervise_source:
+                # Errors of removed source elements, or of the source itself, are handled by reconnection
+                if not self.is_in_pipeline(message.src):
+                    return True
+                if self.is_in_source_bin(message.src):
+                    self.reconnect_source("error")
+                    return True
+            err, debug = message.parse_error()
+            self.error = "%s: %s" % (err.message, debug)
             loop.quit()
 
         return True
 
-    def on_pad_added(self, src, new_pad, target):
+    def on_pad_added(self, src, new_pad, target, src_pad=None):
         '''
-        Callback function called on new pad added
+        Callback function called on new pad added, src_pad is the name or template of the pad to link to target
+        (given by edges), other pads are left to the other callbacks
         '''
+        if src_pad is not None and not StreamGraph.pad_matches(new_pad, src_pad):
+            return
+
         # Get new pad info
         new_pad_name = new_pad.get_name()
         new_pad_caps = new_pad.get_current_caps()
@@ -155,14 +216,14 @@ class StreamPipeline(object):
         elif new_pad_type.startswith("audio"):
             add_block_probe = True
 
-        # Add blocking probe
-        if add_block_probe:
+        # Add blocking probe, unless the pad has been explicitly linked by an edge
+        if add_block_probe and src_pad is None:
             logger.info("Adding blocking probe to the pad: %s" % new_pad_name)
             new_pad.add_probe(Gst.PadProbeType.BLOCK, lambda x,y : Gst.PadProbeReturn.OK)
             return
 
-        # Find target sink pad
-        sink_pad = target.get_static_pad("sink")
+        # Find target sink pad, target is either element or its pad
+        sink_pad = target if isinstance(target, Gst.Pad) else target.get_static_pad("sink")
         if not sink_pad:
             logger.info("Static sink pad not found for element '%s'. Searching by indices..." % target.name)
             for i in range(10):
@@ -184,7 +245,165 @@ class StreamPipeline(object):
         else:
             logger.info("Link succeeded (type '{0:s}')".format(new_pad_type))
 
-    def buffer_probe_callback(self, pad, info, callback):
+    def is_in_pipeline(self, obj):
+        '''
+        Checks if the object is (a descendant of) an element of the pipeline
+        '''
+        while obj is not None:
+            if obj == self.pipeline:
+                return True
+            obj = obj.get_parent()
+        return False
+
+    def is_in_source_bin(self, obj):
+        '''
+        Checks if the object is (a descendant of) an element of the source bin
+        '''
+        source_bin = [self.graph[k] for k in self.get_source_bin()]
+        while obj is not None:
+            if obj in source_bin:
+                return True
+            obj = obj.get_parent()
+        return False
+
+    def get_source_bin(self):
+        '''
+        Returns keys of the source bin elements
+        '''
+        return [k for k in StreamPipeline.SOURCE_BIN if self.graph.contains(k)]
+
+    def get_source_watch_pad(self):
+        '''
+        Returns sink pad of the element downstream of the source bin, which stays in place on reconnection.
+        Source elements may only have sometimes pads (e.g. rtspsrc), so their own pads can't be watched.
+        '''
+        key = self.get_source_bin()[-1]
+        pad = self.graph[key].get_static_pad("src")
+        if pad is not None and pad.get_peer() is not None:
+            return pad.get_peer()
+        if self.source_peer is not None:
+            return self.source_peer
+
+        downstream = self.graph.downstream(key)
+        if downstream is None:
+            return None
+        elem = self.graph[downstream]
+        pad = elem.get_static_pad("sink")
+        if pad is None and len(elem.sinkpads) == 1:
+            pad = elem.sinkpads[0]
+        return pad
+
+    def watch_source(self):
+        '''
+        Adds probe tracking data flow out of the source bin, end of stream from the source triggers reconnection
+        '''
+        pad = self.get_source_watch_pad()
+        if pad is None:
+            logger.warning("No pad to watch downstream of the source, data timeout disabled")
+        elif pad != self.source_watch_pad:
+            pad.add_probe(Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM, self.source_probe_callback)
+        self.source_watch_pad = pad
+        self.last_buffer_time = time.monotonic()
+
+    def source_probe_callback(self, pad, info):
+        '''
+        Callback function called on data leaving the source bin
+        '''
+        if info.type & Gst.PadProbeType.BUFFER:
+            self.last_buffer_time = time.monotonic()
+            if self.reconnect_started is not None:
+                elapsed = self.last_buffer_time - self.reconnect_started
+                self.reconnect_started = None
+                self.reconnect_times.append(elapsed)
+                logger.info("Source reconnected in %.3f sec" % elapsed)
+            return Gst.PadProbeReturn.OK
+
+        # Keep downstream playing when the server ends the stream
+        event = info.get_event()
+        if event is not None and event.type == Gst.EventType.EOS and not self.stopping:
+            GLib.idle_add(self.reconnect_source, "end of stream")
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
+
+    def check_source_timeout(self):
+        '''
+        Periodic check for data timeout, called from the main loop
+        '''
+        if self.stopping or self.source_watch_pad is None:
+            return False
+        now = time.monotonic()
+        last = max(self.last_buffer_time, self.reconnect_started or 0)
+        if now - last > self.data_timeout:
+            self.reconnect_source("no data for %.1f sec" % (now - last))
+        return True
+
+    def reconnect_source(self, reason):
+        '''
+        Rebuilds source bin (source/depay/parse) while downstream elements stay in the playing state
+        '''
+        if self.stopping:
+            return False
+        logger.warning("Reconnecting source of %s: %s" % (self.config["id"], reason))
+        if self.reconnect_started is None:
+            self.reconnect_started = time.monotonic()
+        else:
+            # Previous attempt hasn't delivered data yet, time the next one from now on
+            self.last_buffer_time = time.monotonic()
+        keys = self.get_source_bin()
+
+        # Unlink from downstream
+        last = self.graph[keys[-1]]
+        for pad in last.srcpads:
+            peer = pad.get_peer()
+            if peer is not None:
+                self.source_peer = peer
+                pad.unlink(peer)
+
+        # Remove the old elements
+        for k in keys:
+            self.graph[k].set_state(Gst.State.NULL)
+            self.pipeline.remove(self.graph[k])
+
+        # Create and configure the new ones
+        for k in keys:
+            vertex = self.graph.get(k)
+            vertex.elem = Gst.ElementFactory.make(vertex.factory_name, k)
+            if k in self.config:
+                self.graph.configure(k, self.config[k])
+            self.pipeline.add(vertex.elem)
+
+        # Link the source bin, and to the downstream
+        downstream = self.graph[self.graph.downstream(keys[-1])]
+        for i, k in enumerate(keys):
+            vertex = self.graph.get(k)
+            target = self.graph[keys[i+1]] if i+1 < len(keys) else downstream
+            if not vertex.linkable:
+                vertex.elem.connect("pad-added", self.on_pad_added, target)
+            elif target is not downstream:
+                vertex.elem.link(target)
+            elif self.source_peer is not None:
+                vertex.elem.get_static_pad("src").link(self.source_peer)
+            else:
+                vertex.elem.link(target)
+
+        self.watch_source()
+        for k in keys:
+            self.graph[k].sync_state_with_parent()
+
+        return False
+
+    def get_reconnect_stats(self):
+        '''
+        Returns number of source reconnections and their duration, measured until the first buffer
+        '''
+        n = len(self.reconnect_times)
+        return {
+            "reconnects": n,
+            "last_reconnect_ms": 1000 * self.reconnect_times[-1] if n > 0 else None,
+            "mean_reconnect_ms": 1000 * sum(self.reconnect_times) / n if n > 0 else None
+        }
+
+    def buffer_probe_callback(self, pad, info, probe):
         '''
         Callback function called on buffer probe
         '''
@@ -194,19 +413,58 @@ class StreamPipeline(object):
             logger.error("Unable to get GstBuffer ")
             return Gst.PadProbeReturn.OK
 
+        self.call_probe(probe, gst_buffer, pad.get_current_caps())
+
+        return Gst.PadProbeReturn.OK
+
+    def call_probe(self, probe, gst_buffer, caps):
+        '''
+        Passes buffer to the probe callback as ndarray, if it passes the sampling policy
+        '''
+        # Sampling by flags and timestamps, before any mapping
+        if not probe.accept(gst_buffer):
+            return
+
+        # Buffer layout, parsed from caps only when they change
+        layout = probe.layouts.get(caps)
+
+        # Zero-copy on threads: mapping stays alive as long as the ndarray
+        if probe.zero_copy and probe.executor == "thread":
+            if probe.motion_threshold > 0:
+                with map_gst_buffer_to_ndarray(gst_buffer, layout) as data:
+                    if not probe.has_motion(data):
+                        return
+            probe.dispatch(gst_buffer_with_layout_to_mapped_ndarray(gst_buffer, layout))
+            return
+
+        # Zero-copy: read-only ndarray valid only for the duration of the callback
+        zero_copy = probe.zero_copy and probe.pool is None
+        if zero_copy or probe.motion_threshold > 0:
+            with map_gst_buffer_to_ndarray(gst_buffer, layout) as data:
+                if not probe.has_motion(data):
+                    return
+                if zero_copy:
+                    probe.callback(data)
+                    return
+
         # Convert gst buffer to ndarray
-        data = gst_buffer_with_pad_to_ndarray(gst_buffer, pad, do_copy=True)
+        data = gst_buffer_with_layout_to_ndarray(gst_buffer, layout, do_copy=True)
 
-        # User's callback function
-        callback(data)
+        # User's callback function, on the executor if configured
+        probe.dispatch(data)
 
-        return Gst.PadProbeReturn.OK
+    def get_probe_stats(self):
+        '''
+        Returns statistics of buffer probes, keyed by "element.pad"
+        '''
+        return {k: v.get_stats() for k,v in self.graph.probes.items()}
 
     def send_eos(self, pipeline):
         '''
         Callback function called on End-Of-Stream
         '''
         logger.info("Lights out!")
+        self.stopping = True
         pipeline.send_event(Gst.Event.new_eos())
 
     def start(self, loop=None):
@@ -217,6 +475,16 @@ class StreamPipeline(object):
         bus = self.pipeline.get_bus()
         bus.add_watch(0, self.on_message, (self.pipeline, self.loop if loop is None else loop))
 
+        # Supervise RTSP source: reconnect on errors and data timeouts
+        if not self.graph.parse_launch and self.graph.contains("source") \
+            and self.graph.get("source").factory_name == "rtspsrc" \
+            and self.config.get("source.reconnect") != False:
+            self.supervise_source = True
+            self.data_timeout = self.config.get("source.data_timeout") if self.config.isSet("source.data_timeout") \
+                else StreamPipeline.DEFAULT_DATA_TIMEOUT
+            self.watch_source()
+            GLib.timeout_add(500, self.check_source_timeout)
+
         # Set pipeline state to playing
         self.pipeline.set_state(Gst.State.PLAYING)
 
@@ -243,5 +511,8 @@ class StreamPipeline(object):
         '''
         Stops pipeline and cleans up the resources
         '''
+        self.stopping = True
         self.pipeline.send_event(Gst.Event.new_eos())
         self.pipeline.set_state(Gst.State.NULL)
+        for probe in self.graph.probes.values():
+            probe.close()
@@ -58,10 +58,10 @@ class VideoPipeline(StreamPipeline):
             graph["source_filter"].set_property("caps", source_caps)
 
     @staticmethod
-    def configure_sink(graph, config):
-        if config.get("sink.name") == "hlssink":
+    def configure_sink(graph, config, key="sink"):
+        if config.get(key + ".name") == "hlssink":
             # Remove segments
-            location = config.get("sink.location")
+            location = config.get(key + ".location")
             if location:
                 filename = location.split('%')[0]
                 file_list = glob.glob(filename + '*')
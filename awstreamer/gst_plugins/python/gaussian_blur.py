@@ -29,7 +29,7 @@ import os
 import sys
 sys.path.insert(1, os.path.join(sys.path[0], '../..'))
 from utils.gst_hacks import map_gst_buffer
-from utils.gst import gst_buffer_with_caps_to_ndarray
+from utils.gst import VideoLayout, WritableMapStats, map_gst_buffer_to_writable_ndarray
 
 DEFAULT_KERNEL_SIZE = 3
 DEFAULT_SIGMA_X = 1.0
@@ -107,11 +107,14 @@ class GstGaussianBlur(GstBase.BaseTransform):
         self.kernel_size = DEFAULT_KERNEL_SIZE
         self.sigma_x = DEFAULT_SIGMA_X
         self.sigma_y = DEFAULT_SIGMA_Y
+        self.layout = None
+        self.map_stats = WritableMapStats()
 
     def do_set_caps(self, incaps, outcaps):
         struct = incaps.get_structure(0)
         self.width = struct.get_int("width").value
         self.height = struct.get_int("height").value
+        self.layout = VideoLayout.from_caps(incaps)
         return True
 
     def do_get_property(self, prop: GObject.GParamSpec):
@@ -134,13 +137,17 @@ class GstGaussianBlur(GstBase.BaseTransform):
         else:
             raise AttributeError('unknown property %s' % prop.name)
 
+    def do_stop(self):
+        logging.info("%s: %s" % (self.GST_PLUGIN_NAME, self.map_stats))
+        return True
+
     def do_transform_ip(self, buffer: Gst.Buffer) -> Gst.FlowReturn:
         try:
-            # convert Gst.Buffer to np.ndarray
-            image = gst_buffer_with_caps_to_ndarray(buffer, self.sinkpad.get_current_caps())
+            # map Gst.Buffer to writable np.ndarray
+            with map_gst_buffer_to_writable_ndarray(buffer, self.layout, self.map_stats) as image:
 
-            # apply gaussian blur to image
-            image[:] = gaussian_blur(image, self.kernel_size, sigma=(self.sigma_x, self.sigma_y))
+                # apply gaussian blur to image
+                image[:] = gaussian_blur(image, self.kernel_size, sigma=(self.sigma_x, self.sigma_y))
         except Exception as e:
             logging.error(e)
 
@@ -30,7 +30,7 @@ import os
 import sys
 sys.path.insert(1, os.path.join(sys.path[0], '../..'))
 from utils.gst_hacks import map_gst_buffer
-from utils.gst import gst_buffer_with_caps_to_ndarray
+from utils.gst import VideoLayout, gst_buffer_with_layout_to_ndarray
 from gst_metadata.gst_objects_info_meta import gst_meta_get, gst_meta_write
 
 DEFAULT_MODEL_DIR = ""
@@ -59,11 +59,16 @@ class GstMetadataTest(GstBase.BaseTransform):
 
     def __init__(self):
         super(GstMetadataTest, self).__init__()
+        self.layout = None
+
+    def do_set_caps(self, incaps, outcaps):
+        self.layout = VideoLayout.from_caps(incaps)
+        return True
 
     def do_transform_ip(self, buffer: Gst.Buffer) -> Gst.FlowReturn:
         try:
             # convert Gst.Buffer to np.ndarray
-            image = gst_buffer_with_caps_to_ndarray(buffer, self.sinkpad.get_current_caps())
+            image = gst_buffer_with_layout_to_ndarray(buffer, self.layout)
             h,w = image.shape[0:2]
 
             # Generate random ML inference results
@@ -0,0 +1,200 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+    Plugin detects frames without motion, comparing downscaled frames with the running average of previous ones.
+    Frames without motion are flagged as droppable, or dropped with drop=true, e.g. in front of an ML element
+    on a branch used only for analytics.
+
+    From build folder:
+
+    GST_PLUGIN_PATH=$PWD/libs gst-launch-1.0 videotestsrc pattern=ball ! \
+        video/x-raw,format=RGBA,width=1280,height=720 ! \
+        motiongate threshold=2.0 region=0,0.5,1,1 drop=true ! videoconvert ! fpsdisplaysink sync=false
+"""
+
+import logging
+import cv2
+
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstBase', '1.0')
+from gi.repository import Gst, GLib, GObject, GstBase
+
+import os
+import sys
+sys.path.insert(1, os.path.join(sys.path[0], '../..'))
+from utils.gst import VideoLayout, gst_buffer_with_layout_to_ndarray
+from utils.motion import MotionGate, parse_region, DEFAULT_STEP
+
+DEFAULT_THRESHOLD = 2.0
+DEFAULT_REGION = ""
+DEFAULT_MASK = ""
+DEFAULT_DROP = False
+FORMATS = "{RGBx,BGRx,xRGB,xBGR,RGBA,BGRA,ARGB,ABGR,RGB,BGR,GRAY8,I420,NV12}"
+
+
+class GstMotionGate(GstBase.BaseTransform):
+
+    GST_PLUGIN_NAME = 'motiongate'
+
+    __gstmetadata__ = ("MotionGate",  # Name
+                       "Filter",   # Transform
+                       "Flags or drops frames without motion",  # Description
+                       "Bartek Pawlik <pawlikb@amazon.com>")  # Author
+
+    __gsttemplates__ = (Gst.PadTemplate.new("src",
+                                            Gst.PadDirection.SRC,
+                                            Gst.PadPresence.ALWAYS,
+                                            Gst.Caps.from_string(f"video/x-raw,format={FORMATS}")),
+                        Gst.PadTemplate.new("sink",
+                                            Gst.PadDirection.SINK,
+                                            Gst.PadPresence.ALWAYS,
+                                            Gst.Caps.from_string(f"video/x-raw,format={FORMATS}")))
+
+    __gproperties__ = {
+
+        "threshold": (GObject.TYPE_FLOAT,
+                   "Threshold",
+                   "Mean pixel difference from the background above which the frame has motion",
+                   0.0,  # min
+                   255.0,  # max
+                   DEFAULT_THRESHOLD,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "step": (GObject.TYPE_INT64,
+                   "Step",
+                   "Pixel step of the downscaled frame compared with the background",
+                   1,  # min
+                   GLib.MAXINT,  # max
+                   DEFAULT_STEP,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "region": (GObject.TYPE_STRING,
+                   "Region",
+                   "Region watched for motion: x0,y0,x1,y1 relative to the frame size, empty for the whole frame",
+                   DEFAULT_REGION,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "mask": (GObject.TYPE_STRING,
+                   "Mask",
+                   "Path to grayscale image, its non-zero pixels are watched for motion",
+                   DEFAULT_MASK,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "drop": (GObject.TYPE_BOOLEAN,
+                   "Drop",
+                   "Drop frames without motion instead of flagging them as droppable",
+                   DEFAULT_DROP,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "gated-frames": (GObject.TYPE_UINT64,
+                   "Gated frames",
+                   "Number of frames without motion",
+                   0,  # min
+                   GLib.MAXUINT64,  # max
+                   0,  # default
+                   GObject.ParamFlags.READABLE
+                   ),
+
+        "passed-frames": (GObject.TYPE_UINT64,
+                   "Passed frames",
+                   "Number of frames with motion",
+                   0,  # min
+                   GLib.MAXUINT64,  # max
+                   0,  # default
+                   GObject.ParamFlags.READABLE
+                   ),
+    }
+
+    def __init__(self):
+        super(GstMotionGate, self).__init__()
+
+        # Initialize properties before Base Class initialization
+        self.threshold = DEFAULT_THRESHOLD
+        self.step = DEFAULT_STEP
+        self.region = DEFAULT_REGION
+        self.mask = DEFAULT_MASK
+        self.drop = DEFAULT_DROP
+        self.layout = None
+        self.gate = MotionGate(self.threshold)
+
+    def do_set_caps(self, incaps, outcaps):
+        self.layout = VideoLayout.from_caps(incaps)
+        self.gate.reset()
+        return True
+
+    def do_get_property(self, prop: GObject.GParamSpec):
+        if prop.name == 'threshold':
+            return self.threshold
+        elif prop.name == 'step':
+            return self.step
+        elif prop.name == 'region':
+            return self.region
+        elif prop.name == 'mask':
+            return self.mask
+        elif prop.name == 'drop':
+            return self.drop
+        elif prop.name == 'gated-frames':
+            return self.gate.gated
+        elif prop.name == 'passed-frames':
+            return self.gate.passed
+        else:
+            raise AttributeError('unknown property %s' % prop.name)
+
+    def do_set_property(self, prop: GObject.GParamSpec, value):
+        if prop.name == 'threshold':
+            self.threshold = value
+        elif prop.name == 'step':
+            self.step = value
+        elif prop.name == 'region':
+            parse_region(value)
+            self.region = value
+        elif prop.name == 'mask':
+            self.mask = value
+        elif prop.name == 'drop':
+            self.drop = value
+        else:
+            raise AttributeError('unknown property %s' % prop.name)
+
+    def do_start(self):
+        mask = None
+        if self.mask != "":
+            mask = cv2.imread(self.mask, cv2.IMREAD_GRAYSCALE)
+            if mask is None:
+                logging.error("%s: failed to read mask %s" % (self.GST_PLUGIN_NAME, self.mask))
+                return False
+        self.gate = MotionGate(self.threshold, step=self.step, region=parse_region(self.region), mask=mask)
+        return True
+
+    def do_stop(self):
+        logging.info("%s: %s" % (self.GST_PLUGIN_NAME, self.gate.get_stats()))
+        return True
+
+    def do_transform_ip(self, buffer: Gst.Buffer) -> Gst.FlowReturn:
+        try:
+            # convert Gst.Buffer to np.ndarray
+            image = gst_buffer_with_layout_to_ndarray(buffer, self.layout)
+
+            if self.gate.check(image):
+                return Gst.FlowReturn.OK
+
+            if self.drop:
+                return GstBase.BASE_TRANSFORM_FLOW_DROPPED
+            buffer.set_flags(Gst.BufferFlags.DROPPABLE)
+
+        except Exception as e:
+            logging.error(e)
+
+        return Gst.FlowReturn.OK
+
+
+# Register plugin dynamically
+GObject.type_register(GstMotionGate)
+__gstelementfactory__ = (GstMotionGate.GST_PLUGIN_NAME,
+                         Gst.Rank.NONE, GstMotionGate)
@@ -10,6 +10,18 @@
     GST_PLUGIN_PATH=$PWD/libs gst-launch-1.0 videotestsrc ! \
         video/x-raw,format=RGBA,width=1280,height=720 ! timeoverlay ! \
         neodlr ! osd ! videoconvert ! fpsdisplaysink sync=false
+
+    With inference-threads > 0 inference runs on worker threads, in batches of batch-size frames
+    collected for up to max-batch-latency-ms, shared by all neodlr instances of the process with the same model.
+    In batch-mode=hold buffers are held until their results are attached, in batch-mode=pass-through
+    buffers pass immediately with the latest results available.
+
+    Models are loaded and warmed up on a background thread when the element starts, frames pass through
+    untouched until the model is ready. Loaded models are shared by all neodlr instances of the process
+    with the same input shape.
+
+    With motion-threshold > 0 inference is skipped on frames without motion (see motiongate),
+    which get the last detections attached instead.
 """
 
 from dlr.counter.phone_home import PhoneHome
@@ -20,10 +32,11 @@ import logging
 import timeit
 import traceback
 from typing import Tuple
+from collections import deque
+from threading import Thread, Lock, Condition, Event
 import time
 import cv2
 import numpy as np
-import os
 
 import gi
 gi.require_version('Gst', '1.0')
@@ -35,15 +48,200 @@ import os
 import sys
 sys.path.insert(1, os.path.join(sys.path[0], '../..'))
 from utils.gst_hacks import map_gst_buffer
-from utils.gst import gst_buffer_with_caps_to_ndarray
-from gst_metadata.gst_objects_info_meta import gst_meta_get, gst_meta_write
+from utils.gst import VideoLayout, gst_buffer_with_layout_to_ndarray
+from utils.motion import MotionGate, parse_region
+from gst_metadata.gst_objects_info_meta import OBJECT_INFO_DTYPE, class_name_ptr, gst_meta_write_array
 
 DEFAULT_MODEL_DIR = ""
 DEFAULT_DEVICE_TYPE = "cpu"
 DEFAULT_IMAGE_SIZE = 320
 DEFAULT_THRESHOLD = 0.0
+DEFAULT_MEAN = "0,0,0"
+DEFAULT_STD = "1,1,1"
+DEFAULT_MOTION_THRESHOLD = 0.0
+DEFAULT_MOTION_REGION = ""
+DEFAULT_MOTION_MASK = ""
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_MAX_BATCH_LATENCY_MS = 10
+DEFAULT_INFERENCE_THREADS = 0
+DEFAULT_BATCH_MODE = "hold"
+BATCH_MODES = ["hold", "pass-through"]
+NO_OBJECTS = np.empty(0, dtype=OBJECT_INFO_DTYPE)
 FORMATS = "{RGBx,BGRx,xRGB,xBGR,RGBA,BGRA,ARGB,ABGR,RGB,BGR}"
 
+def parse_channels(value: str) -> np.ndarray:
+    """Parses comma-separated per-channel values (one or three) into (channels, 1, 1) array"""
+    values = [float(v) for v in value.split(",")]
+    if len(values) not in [1, 3]:
+        raise ValueError('expected 1 or 3 comma-separated values, got %s' % value)
+    return np.asarray(values, dtype=np.float32).reshape(-1, 1, 1)
+
+
+class SharedModel:
+    """DLR model loaded on a background thread, run calls are serialized"""
+
+    def __init__(self, model_dir, device_type, input_shape):
+        self.model_dir = model_dir
+        self.device_type = device_type
+        self.input_shape = input_shape
+        self.model = None
+        self.error = None
+        self.load_time = None
+        self.warmup_time = None
+        self.ready = Event()
+        self.lock = Lock()
+
+    def load(self):
+        try:
+            start_time = time.time()
+            model = DLRModel(self.model_dir, self.device_type)
+            self.load_time = time.time() - start_time
+
+            # First run initializes the engine
+            start_time = time.time()
+            model.run(np.zeros(self.input_shape, dtype=np.float32))
+            self.warmup_time = time.time() - start_time
+
+            self.model = model
+            logging.info("Loaded model %s on %s: load %.3f s, warmup %.3f s" %
+                         (self.model_dir, self.device_type, self.load_time, self.warmup_time))
+        except Exception as e:
+            self.error = e
+            logging.error("Failed to load model %s on %s: %s" % (self.model_dir, self.device_type, e))
+        finally:
+            self.ready.set()
+
+    def is_ready(self) -> bool:
+        return self.model is not None
+
+    def wait(self) -> bool:
+        self.ready.wait()
+        return self.is_ready()
+
+    def run(self, x):
+        with self.lock:
+            return self.model.run(x)
+
+
+class ModelRegistry:
+    """Per-process cache of models shared by neodlr instances, keyed by (model-dir, device-type, input shape)
+
+        Input shape (batch, 3, image-size, image-size) is part of the key, as the model is warmed up for it. Each replica is a separate copy of the model, for inference threads running in parallel.
+        Models stay loaded for the lifetime of the process.
+    """
+
+    models = dict()
+    lock = Lock()
+
+    @staticmethod
+    def get(model_dir, device_type, input_shape, replica=0) -> SharedModel:
+        """Returns the model, starting to load it on a background thread if not loaded yet"""
+        key = (model_dir, device_type, tuple(input_shape), replica)
+        with ModelRegistry.lock:
+            model = ModelRegistry.models.get(key)
+            if model is None:
+                model = SharedModel(model_dir, device_type, input_shape)
+                ModelRegistry.models[key] = model
+                Thread(target=model.load, daemon=True).start()
+            return model
+
+
+class InferenceBatcher:
+    """Collects frames from neodlr instances and runs them in batches on worker threads
+
+        Each worker thread loads its own copy of the model. Batch is padded to batch_size,
+        as models are compiled for a fixed input shape.
+    """
+
+    # Shared batchers, keyed by model, device, image size and batch size
+    registry = dict()
+    registry_lock = Lock()
+
+    def __init__(self, model_dir, device_type, image_size, batch_size, max_latency_ms, threads):
+        self.model_dir = model_dir
+        self.device_type = device_type
+        self.image_size = image_size
+        self.batch_size = batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.queue = deque()
+        self.cond = Condition()
+        self.running = True
+        self.users = 0
+        shape = (batch_size, 3, image_size, image_size)
+        self.models = [ModelRegistry.get(model_dir, device_type, shape, replica=i) for i in range(threads)]
+        self.threads = [Thread(target=self.run, args=[model], daemon=True) for model in self.models]
+        for thread in self.threads:
+            thread.start()
+
+    @staticmethod
+    def acquire(model_dir, device_type, image_size, batch_size, max_latency_ms, threads):
+        key = (model_dir, device_type, image_size, batch_size)
+        with InferenceBatcher.registry_lock:
+            batcher = InferenceBatcher.registry.get(key)
+            if batcher is None:
+                batcher = InferenceBatcher(model_dir, device_type, image_size, batch_size, max_latency_ms, threads)
+                InferenceBatcher.registry[key] = batcher
+            batcher.users += 1
+            return batcher
+
+    def release(self):
+        key = (self.model_dir, self.device_type, self.image_size, self.batch_size)
+        with InferenceBatcher.registry_lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            del InferenceBatcher.registry[key]
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def submit(self, tensor, callback):
+        """Queues preprocessed frame (3, image_size, image_size), callback is called with its outputs"""
+        with self.cond:
+            self.queue.append((tensor, callback))
+            self.cond.notify()
+
+    def collect(self):
+        """Waits for the first frame, then for up to max latency until the batch is full"""
+        with self.cond:
+            while len(self.queue) == 0 and self.running:
+                self.cond.wait()
+            if not self.running:
+                return None
+            deadline = time.monotonic() + self.max_latency
+            while len(self.queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.running:
+                    break
+                self.cond.wait(remaining)
+            return [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+
+    def is_ready(self) -> bool:
+        return any(model.is_ready() for model in self.models)
+
+    def run(self, model):
+        if not model.wait():
+            return
+        batch = np.zeros((self.batch_size, 3, self.image_size, self.image_size), dtype=np.float32)
+
+        while True:
+            items = self.collect()
+            if items is None:
+                break
+            for i, (tensor, callback) in enumerate(items):
+                batch[i] = tensor
+            batch[len(items):] = 0
+
+            try:
+                outputs = model.run(batch)
+            except Exception as e:
+                logging.error(e)
+                outputs = None
+
+            for i, (tensor, callback) in enumerate(items):
+                callback(None if outputs is None else [output[i:i+1] for output in outputs])
+
+
 class GstNeoDLR(GstBase.BaseTransform):
 
     GST_PLUGIN_NAME = 'neodlr'
@@ -95,6 +293,95 @@ class GstNeoDLR(GstBase.BaseTransform):
                    DEFAULT_THRESHOLD,  # default
                    GObject.ParamFlags.READWRITE
                    ),
+
+        "mean": (GObject.TYPE_STRING,
+                   "Mean",
+                   "Per-channel mean subtracted from the input, comma-separated, in frame channel order",
+                   DEFAULT_MEAN,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "std": (GObject.TYPE_STRING,
+                   "Standard deviation",
+                   "Per-channel standard deviation the input is divided by, comma-separated, in frame channel order",
+                   DEFAULT_STD,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "motion-threshold": (GObject.TYPE_FLOAT,
+                   "Motion threshold",
+                   "Mean pixel difference from the background below which inference is skipped, 0 disables motion gating",
+                   0.0,  # min
+                   255.0,  # max
+                   DEFAULT_MOTION_THRESHOLD,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "motion-region": (GObject.TYPE_STRING,
+                   "Motion region",
+                   "Region watched for motion: x0,y0,x1,y1 relative to the frame size, empty for the whole frame",
+                   DEFAULT_MOTION_REGION,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "motion-mask": (GObject.TYPE_STRING,
+                   "Motion mask",
+                   "Path to grayscale image, its non-zero pixels are watched for motion",
+                   DEFAULT_MOTION_MASK,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "gated-frames": (GObject.TYPE_UINT64,
+                   "Gated frames",
+                   "Number of frames without motion, inference skipped",
+                   0,  # min
+                   GLib.MAXUINT64,  # max
+                   0,  # default
+                   GObject.ParamFlags.READABLE
+                   ),
+
+        "inferred-frames": (GObject.TYPE_UINT64,
+                   "Inferred frames",
+                   "Number of frames inference was run on",
+                   0,  # min
+                   GLib.MAXUINT64,  # max
+                   0,  # default
+                   GObject.ParamFlags.READABLE
+                   ),
+
+        "batch-size": (GObject.TYPE_INT64,
+                   "Batch size",
+                   "Number of frames run in one inference call, has to match the model input",
+                   1,  # min
+                   GLib.MAXINT,  # max
+                   DEFAULT_BATCH_SIZE,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "max-batch-latency-ms": (GObject.TYPE_INT64,
+                   "Maximum batch latency",
+                   "Time to wait for the batch to fill up after its first frame, in milliseconds",
+                   0,  # min
+                   GLib.MAXINT,  # max
+                   DEFAULT_MAX_BATCH_LATENCY_MS,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "inference-threads": (GObject.TYPE_INT64,
+                   "Inference threads",
+                   "Number of inference worker threads, 0 runs inference on the streaming thread",
+                   0,  # min
+                   GLib.MAXINT,  # max
+                   DEFAULT_INFERENCE_THREADS,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "batch-mode": (GObject.TYPE_STRING,
+                   "Batch mode",
+                   "hold: buffers wait for their results, pass-through: buffers get the latest results available",
+                   DEFAULT_BATCH_MODE,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
     }
 
     def __init__(self):
@@ -106,7 +393,43 @@ class GstNeoDLR(GstBase.BaseTransform):
         self.device_type = DEFAULT_DEVICE_TYPE
         self.image_size = DEFAULT_IMAGE_SIZE
         self.threshold = DEFAULT_THRESHOLD
-        self.model = None
+        self.mean = DEFAULT_MEAN
+        self.std = DEFAULT_STD
+        self.mean_values = parse_channels(DEFAULT_MEAN)
+        self.std_inv = 1.0 / parse_channels(DEFAULT_STD)
+        self.motion_threshold = DEFAULT_MOTION_THRESHOLD
+        self.motion_region = DEFAULT_MOTION_REGION
+        self.motion_mask = DEFAULT_MOTION_MASK
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.max_batch_latency_ms = DEFAULT_MAX_BATCH_LATENCY_MS
+        self.inference_threads = DEFAULT_INFERENCE_THREADS
+        self.batch_mode = DEFAULT_BATCH_MODE
+        self.model = None  # SharedModel
+        self.layout = None
+
+        # Motion gating, last detections are attached to frames without motion
+        self.motion = None
+        self.last_objects = NO_OBJECTS
+        self.gated = 0
+        self.inferred = 0
+
+        # Preallocated preprocessing buffers, reused for every frame
+        self.resized = None
+        self.input = None
+
+        # Asynchronous inference state
+        self.batcher = None
+        self.lock = Condition()
+        self.submitted = 0
+        self.next_push = 0
+        self.completed = dict()
+        self.latest = (-1, NO_OBJECTS)
+        self.class_name = class_name_ptr("class_name")
+        self.flow_return = Gst.FlowReturn.OK
+
+    def do_set_caps(self, incaps, outcaps):
+        self.layout = VideoLayout.from_caps(incaps)
+        return True
 
     def do_get_property(self, prop: GObject.GParamSpec):
         if prop.name == 'model-dir':
@@ -117,29 +440,31 @@ class GstNeoDLR(GstBase.BaseTransform):
             return self.image_size
         elif prop.name == 'threshold':
             return self.threshold
+        elif prop.name == 'mean':
+            return self.mean
+        elif prop.name == 'std':
+            return self.std
+        elif prop.name == 'motion-threshold':
+            return self.motion_threshold
+        elif prop.name == 'motion-region':
+            return self.motion_region
+        elif prop.name == 'motion-mask':
+            return self.motion_mask
+        elif prop.name == 'gated-frames':
+            return self.gated
+        elif prop.name == 'inferred-frames':
+            return self.inferred
+        elif prop.name == 'batch-size':
+            return self.batch_size
+        elif prop.name == 'max-batch-latency-ms':
+            return self.max_batch_latency_ms
+        elif prop.name == 'inference-threads':
+            return self.inference_threads
+        elif prop.name == 'batch-mode':
+            return self.batch_mode
         else:
             raise AttributeError('unknown property %s' % prop.name)
 
-    def load_model(self):
-        if self.model is not None:
-            return
-        if self.model_dir == "":
-            return
-        if os.path.exists(self.model_dir):
-            # Load model
-            print("Loading model from %s..." % self.model_dir)
-            self.model = DLRModel(self.model_dir, self.device_type)
-            print("Done.")
-
-            print ("Warming up DLR engine...")
-            start_time = time.time()
-            x = np.random.rand(1, 3, self.image_size, self.image_size)
-            result = self.model.run(x)
-            print(len(result))
-            print(result[0].shape)
-            print('inference time is ' + str((time.time()-start_time)) + ' seconds')
-            print ("Done.")
-
     def do_set_property(self, prop: GObject.GParamSpec, value):
         if prop.name == 'model-dir':
             self.model_dir = value
@@ -149,63 +474,233 @@ class GstNeoDLR(GstBase.BaseTransform):
             self.image_size = value
         elif prop.name == 'threshold':
             self.threshold = value
+        elif prop.name == 'mean':
+            self.mean_values = parse_channels(value)
+            self.mean = value
+        elif prop.name == 'std':
+            self.std_inv = 1.0 / parse_channels(value)
+            self.std = value
+        elif prop.name == 'motion-threshold':
+            self.motion_threshold = value
+        elif prop.name == 'motion-region':
+            parse_region(value)
+            self.motion_region = value
+        elif prop.name == 'motion-mask':
+            self.motion_mask = value
+        elif prop.name == 'batch-size':
+            self.batch_size = value
+        elif prop.name == 'max-batch-latency-ms':
+            self.max_batch_latency_ms = value
+        elif prop.name == 'inference-threads':
+            self.inference_threads = value
+        elif prop.name == 'batch-mode':
+            if value not in BATCH_MODES:
+                raise ValueError('unknown batch mode %s, expected one of: %s' % (value, BATCH_MODES))
+            self.batch_mode = value
         else:
             raise AttributeError('unknown property %s' % prop.name)
 
+    def preprocess(self, image, out=None):
+        """Resizes, transposes HWC to CHW and normalizes the image into out (3, image-size, image-size)
+
+            Without out, the preallocated input tensor of the element is filled and returned.
+        """
+        size = self.image_size
+        if self.resized is None or self.resized.shape[0] != size or self.resized.shape[2:] != image.shape[2:]:
+            self.resized = np.empty((size, size) + image.shape[2:], dtype=image.dtype)
+            self.input = np.empty((1, 3, size, size), dtype=np.float32)
+        if out is None:
+            out = self.input[0]
+
+        # Resize all channels (no copy of the full frame to drop padding), then drop padding on the small one
+        cv2.resize(image, (size, size), dst=self.resized)
+        np.subtract(self.resized[:,:,:3].transpose(2, 0, 1), self.mean_values, out=out)
+        np.multiply(out, self.std_inv, out=out)
+        return out
+
+    def postprocess(self, result):
+        """Returns detections above the threshold from the model outputs of one frame, as OBJECT_INFO_DTYPE array
+
+            Boxes (x0, y0, x1, y1) are scaled from the model input to the frame size and clipped to the frame.
+        """
+        class_ids = np.reshape(result[0], -1)
+        scores = np.reshape(result[1], -1)
+        boxes = np.reshape(result[2], (-1, 4))
+
+        mask = scores >= self.threshold
+        width, height = (self.layout.width, self.layout.height) if self.layout is not None \
+            else (self.image_size, self.image_size)
+        scale = np.array([width, height, width, height], dtype=np.float32) / self.image_size
+        boxes = boxes[mask] * scale
+        np.clip(boxes, 0, [width - 1, height - 1, width - 1, height - 1], out=boxes)
+
+        objects = np.zeros(len(boxes), dtype=OBJECT_INFO_DTYPE)
+        objects["x"], objects["y"], objects["width"], objects["height"] = boxes.T
+        objects["confidence"] = scores[mask]
+        objects["class_name"] = self.class_name
+        objects["track_id"] = class_ids[mask]
+        return objects
+
+    def do_start(self):
+        self.flow_return = Gst.FlowReturn.OK
+        if self.motion_threshold > 0:
+            mask = None
+            if self.motion_mask != "":
+                mask = cv2.imread(self.motion_mask, cv2.IMREAD_GRAYSCALE)
+                if mask is None:
+                    logging.error("%s: failed to read motion mask %s" % (self.GST_PLUGIN_NAME, self.motion_mask))
+                    return False
+            self.motion = MotionGate(self.motion_threshold, region=parse_region(self.motion_region), mask=mask)
+        # Start loading the model, frames pass through until it's ready
+        if self.model_dir == "":
+            logging.warning("%s: model-dir not set, passing frames through" % self.GST_PLUGIN_NAME)
+        elif self.inference_threads == 0:
+            self.model = ModelRegistry.get(self.model_dir, self.device_type, (1, 3, self.image_size, self.image_size))
+        else:
+            self.batcher = InferenceBatcher.acquire(self.model_dir, self.device_type, self.image_size,
+                                                    self.batch_size, self.max_batch_latency_ms, self.inference_threads)
+        return True
+
+    def do_stop(self):
+        logging.info("%s: gated %d, inferred %d frames" % (self.GST_PLUGIN_NAME, self.gated, self.inferred))
+        self.motion = None
+        self.last_objects = NO_OBJECTS
+        if self.batcher is not None:
+            self.batcher.release()
+            self.batcher = None
+        self.model = None
+        self.drop_held()
+        return True
+
+    def drop_held(self):
+        """Drops held buffers, results still in flight for them are ignored"""
+        with self.lock:
+            self.completed.clear()
+            self.next_push = self.submitted
+            self.flow_return = Gst.FlowReturn.OK
+            self.lock.notify_all()
+
+    def do_sink_event(self, event):
+        # Serialized events (e.g. EOS, segment) must not overtake the held buffers
+        if self.batcher is not None and self.batch_mode == "hold" and event.is_serialized():
+            with self.lock:
+                while self.next_push < self.submitted and self.batcher is not None:
+                    self.lock.wait(0.1)
+        if event.type == Gst.EventType.FLUSH_STOP:
+            self.drop_held()
+        return GstBase.BaseTransform.do_sink_event(self, event)
+
+    def has_motion(self, image) -> bool:
+        """Checks the frame with the motion gate and counts gated and inferred frames"""
+        if self.motion is not None and not self.motion.check(image):
+            self.gated += 1
+            return False
+        self.inferred += 1
+        return True
+
+    def on_result(self, seq, buffer, outputs):
+        """Called on the inference thread with model outputs of the frame"""
+        try:
+            objects = NO_OBJECTS if outputs is None else self.postprocess(outputs)
+        except Exception as e:
+            logging.error(e)
+            objects = NO_OBJECTS
+
+        with self.lock:
+            if buffer is None:
+                # Pass-through: keep the latest results
+                if seq > self.latest[0]:
+                    self.latest = (seq, objects)
+                return
+        self.complete(seq, buffer, objects)
+
+    def complete(self, seq, buffer, objects):
+        """Pushes held buffers in order, objects None attaches detections of the previous frame"""
+        with self.lock:
+            # Held buffers have been dropped on stop or flush
+            if seq < self.next_push:
+                return
+            self.completed[seq] = (buffer, objects)
+            while self.next_push in self.completed:
+                buffer, objects = self.completed.pop(self.next_push)
+                self.next_push += 1
+                if objects is None:
+                    objects = self.last_objects
+                else:
+                    self.last_objects = objects
+                gst_meta_write_array(buffer, objects)
+                ret = self.srcpad.push(buffer)
+                # Flushing is temporary, the flow recovers on FLUSH_STOP
+                if ret != Gst.FlowReturn.OK and ret != Gst.FlowReturn.FLUSHING:
+                    self.flow_return = ret
+            self.lock.notify_all()
+
+    def transform_async(self, buffer: Gst.Buffer) -> Gst.FlowReturn:
+        """Submits frame to the batcher, buffer is pushed from the inference thread in hold mode"""
+        if self.flow_return != Gst.FlowReturn.OK:
+            return self.flow_return
+        if not self.batcher.is_ready():
+            return Gst.FlowReturn.OK
+
+        image = gst_buffer_with_layout_to_ndarray(buffer, self.layout)
+        static = not self.has_motion(image)
+
+        if self.batch_mode == "hold":
+            with self.lock:
+                seq = self.submitted
+                self.submitted += 1
+
+            # Own a reference to the buffer, base class drops its own one
+            buffer = buffer.copy()
+            if static:
+                self.complete(seq, buffer, None)
+            else:
+                # Queued tensor can't be the reused input tensor
+                tensor = self.preprocess(image, np.empty((3, self.image_size, self.image_size), dtype=np.float32))
+                self.batcher.submit(tensor, lambda outputs: self.on_result(seq, buffer, outputs))
+            return GstBase.BASE_TRANSFORM_FLOW_DROPPED
+
+        if not static:
+            tensor = self.preprocess(image, np.empty((3, self.image_size, self.image_size), dtype=np.float32))
+            with self.lock:
+                seq = self.submitted
+                self.submitted += 1
+            self.batcher.submit(tensor, lambda outputs: self.on_result(seq, None, outputs))
+        gst_meta_write_array(buffer, self.latest[1])
+        return Gst.FlowReturn.OK
+
     def do_transform_ip(self, buffer: Gst.Buffer) -> Gst.FlowReturn:
         try:
-            # Load the model
-            if self.model is None:
-                self.load_model()
+            # Batched inference on worker threads
+            if self.batcher is not None:
+                return self.transform_async(buffer)
 
-            # Check if model has been loaded
-            if self.model is None:
+            # Pass frames through until the model is loaded
+            if self.model is None or not self.model.is_ready():
                 return Gst.FlowReturn.OK
 
             # convert Gst.Buffer to np.ndarray
-            image = gst_buffer_with_caps_to_ndarray(buffer, self.sinkpad.get_current_caps())
+            image = gst_buffer_with_layout_to_ndarray(buffer, self.layout)
+
+            # Skip inference on frames without motion
+            if not self.has_motion(image):
+                gst_meta_write_array(buffer, self.last_objects)
+                return Gst.FlowReturn.OK
 
             print('Testing inference...')
             start_time = time.time()
-            # img_rand = np.random.rand(1, 3, 320, 320)
 
             # Prepare input
-            image_3 = image[:,:,:3]
-            img_small = cv2.resize(image_3, (self.image_size, self.image_size))
-            img_reshaped = np.reshape(img_small, (1, 3, self.image_size, self.image_size))
-
-            # # Normalize & transpose
-            # mean_vec = np.array([0.485, 0.456, 0.406])
-            # stddev_vec = np.array([0.229, 0.224, 0.225])
-            # img_reshaped = (img_reshaped/255 - mean_vec)/stddev_vec
-            # img_reshaped = np.rollaxis(img_reshaped, axis=2, start=0)[np.newaxis, :]
+            self.preprocess(image)
 
             # Run inference
-            result = self.model.run(img_reshaped)
+            result = self.model.run(self.input)
             print('inference time is ' + str((time.time()-start_time)) + ' seconds')
 
             # Process inference output
-            temp = []
-            for r in result:
-                r = np.squeeze(r)
-                temp.append(r.tolist())
-            idx, score, bbox = temp
-            bbox = np.asarray(bbox)
-            res = np.hstack((np.column_stack((idx, score)), bbox))
-            l = list()
-            for r in res:
-                (class_id, score, x0, y0, x1, y1) = r
-                if score < self.threshold:
-                    continue
-                d = {
-                    "bounding_box": (int(x0), int(y0), int(x1), int(y1)),
-                    "confidence": score,
-                    "class_name": "class_name",
-                    "track_id": int(class_id)
-                }
-                l.append(d)
-            print(l)
-            gst_meta_write(buffer, l)
+            objects = self.postprocess(result)
+            self.last_objects = objects
+            gst_meta_write_array(buffer, objects)
 
         except Exception as e:
             logging.error(e)
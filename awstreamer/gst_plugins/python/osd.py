@@ -5,6 +5,10 @@
 """
     Plugin draws bounding boxes and text on frame from metadata
 
+    Boxes are coloured by class id (track_id of the metadata). With show-labels=true each box is labelled
+    with its class name from labels (comma-separated, indexed by class id) or class id, and confidence
+    with show-confidence=true.
+
     From build folder:
 
     GST_PLUGIN_PATH=$PWD/libs gst-launch-1.0 videotestsrc ! \
@@ -17,7 +21,6 @@ import timeit
 import traceback
 from typing import Tuple
 import time
-import cv2
 import numpy as np
 
 import gi
@@ -30,10 +33,14 @@ import os
 import sys
 sys.path.insert(1, os.path.join(sys.path[0], '../..'))
 from utils.gst_hacks import map_gst_buffer
-from utils.gst import gst_buffer_with_caps_to_ndarray
-from gst_metadata.gst_objects_info_meta import gst_meta_get, gst_meta_write
+from utils.gst import VideoLayout, WritableMapStats, map_gst_buffer_to_writable_ndarray
+from utils.draw import GlyphCache, draw_objects, DEFAULT_FONT_SCALE
+from gst_metadata.gst_objects_info_meta import gst_meta_get_array
 
 DEFAULT_BORDER= 3
+DEFAULT_LABELS = ""
+DEFAULT_SHOW_LABELS = False
+DEFAULT_SHOW_CONFIDENCE = False
 FORMATS = "{RGBx,BGRx,xRGB,xBGR,RGBA,BGRA,ARGB,ABGR,RGB,BGR}"
 
 
@@ -65,6 +72,36 @@ class GstOnScreenDisplay(GstBase.BaseTransform):
                    DEFAULT_BORDER,  # default
                    GObject.ParamFlags.READWRITE  # flags
                    ),
+
+        "labels": (GObject.TYPE_STRING,
+                   "Labels",
+                   "Comma-separated class names, indexed by class id",
+                   DEFAULT_LABELS,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "show-labels": (GObject.TYPE_BOOLEAN,
+                   "Show labels",
+                   "Draw class name (or class id) above boxes",
+                   DEFAULT_SHOW_LABELS,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "show-confidence": (GObject.TYPE_BOOLEAN,
+                   "Show confidence",
+                   "Append confidence to labels",
+                   DEFAULT_SHOW_CONFIDENCE,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
+
+        "font-scale": (GObject.TYPE_FLOAT,
+                   "Font scale",
+                   "Scale of the label font",
+                   0.1,  # min
+                   GLib.MAXFLOAT,  # max
+                   DEFAULT_FONT_SCALE,  # default
+                   GObject.ParamFlags.READWRITE
+                   ),
     }
 
     def __init__(self):
@@ -72,30 +109,65 @@ class GstOnScreenDisplay(GstBase.BaseTransform):
 
         # Initialize properties before Base Class initialization
         self.border = DEFAULT_BORDER
+        self.labels = DEFAULT_LABELS
+        self.label_list = []
+        self.show_labels = DEFAULT_SHOW_LABELS
+        self.show_confidence = DEFAULT_SHOW_CONFIDENCE
+        self.font_scale = DEFAULT_FONT_SCALE
+        self.glyphs = GlyphCache(self.font_scale)
+        self.layout = None
+        self.map_stats = WritableMapStats()
+
+    def do_set_caps(self, incaps, outcaps):
+        self.layout = VideoLayout.from_caps(incaps)
+        return True
 
     def do_get_property(self, prop: GObject.GParamSpec):
         if prop.name == 'border':
             return self.border
+        elif prop.name == 'labels':
+            return self.labels
+        elif prop.name == 'show-labels':
+            return self.show_labels
+        elif prop.name == 'show-confidence':
+            return self.show_confidence
+        elif prop.name == 'font-scale':
+            return self.font_scale
         else:
             raise AttributeError('unknown property %s' % prop.name)
 
     def do_set_property(self, prop: GObject.GParamSpec, value):
         if prop.name == 'border':
             self.border = value
+        elif prop.name == 'labels':
+            self.labels = value
+            self.label_list = [label.strip() for label in value.split(",")] if value else []
+        elif prop.name == 'show-labels':
+            self.show_labels = value
+        elif prop.name == 'show-confidence':
+            self.show_confidence = value
+        elif prop.name == 'font-scale':
+            self.font_scale = value
+            self.glyphs = GlyphCache(value)
         else:
             raise AttributeError('unknown property %s' % prop.name)
 
+    def do_stop(self):
+        logging.info("%s: %s" % (self.GST_PLUGIN_NAME, self.map_stats))
+        return True
+
     def do_transform_ip(self, buffer: Gst.Buffer) -> Gst.FlowReturn:
         try:
-            # convert Gst.Buffer to np.ndarray
-            image = gst_buffer_with_caps_to_ndarray(buffer, self.sinkpad.get_current_caps())
-
-            d = gst_meta_get(buffer)
-            print("OSD:")
-            print(d)
-            for r in d:
-                bb = r['bounding_box']
-                cv2.rectangle(image, (bb[0], bb[1]), (bb[2], bb[3]), (0,255,0), self.border)
+            objects = gst_meta_get_array(buffer)
+            if len(objects) == 0:
+                return Gst.FlowReturn.OK
+
+            # map Gst.Buffer to writable np.ndarray
+            with map_gst_buffer_to_writable_ndarray(buffer, self.layout, self.map_stats) as image:
+                draw_objects(image, objects, self.border,
+                             glyphs=self.glyphs if self.show_labels else None,
+                             labels=self.label_list,
+                             show_confidence=self.show_confidence)
 
         except Exception as e:
             logging.error(e)
@@ -0,0 +1,131 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import typing as typ
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Colours of classes, indexed by class id modulo palette size
+PALETTE = np.array([
+    (31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40), (148, 103, 189),
+    (140, 86, 75), (227, 119, 194), (127, 127, 127), (188, 189, 34), (23, 190, 207),
+    (174, 199, 232), (255, 187, 120), (152, 223, 138), (255, 152, 150), (197, 176, 213),
+    (196, 156, 148), (247, 182, 210), (199, 199, 199), (219, 219, 141), (158, 218, 229)
+], dtype=np.uint8)
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+DEFAULT_FONT_SCALE = 0.5
+DEFAULT_GLYPH_CACHE_SIZE = 1024
+
+
+def concat_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """ Concatenation of np.arange(start, start + length) for all starts and lengths, without Python loop """
+    lengths = np.maximum(lengths, 0)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.intp)
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(total)
+
+
+def draw_boxes(image: np.ndarray, boxes: np.ndarray, colors: np.ndarray, thickness: int = 1):
+    """ Draws rectangles of all boxes at once
+
+    :param image: [height, width, channels >= 3]
+    :param boxes: [N, 4] corners (x0, y0, x1, y1), clipped to the image
+    :param colors: [N, 3]
+    :param thickness: in pixels, drawn inside the box
+    """
+    if len(boxes) == 0:
+        return
+    height, width = image.shape[:2]
+    boxes = np.asarray(boxes, dtype=np.intp)
+    x0 = np.clip(np.minimum(boxes[:, 0], boxes[:, 2]), 0, width - 1)
+    x1 = np.clip(np.maximum(boxes[:, 0], boxes[:, 2]), 0, width - 1)
+    y0 = np.clip(np.minimum(boxes[:, 1], boxes[:, 3]), 0, height - 1)
+    y1 = np.clip(np.maximum(boxes[:, 1], boxes[:, 3]), 0, height - 1)
+
+    # Horizontal and vertical edges of all boxes, one fancy-index assignment per edge and border pixel
+    widths, heights = x1 - x0 + 1, y1 - y0 + 1
+    cols, rows = concat_ranges(x0, widths), concat_ranges(y0, heights)
+    h_colors, v_colors = np.repeat(colors, widths, axis=0), np.repeat(colors, heights, axis=0)
+    for t in range(thickness):
+        image[np.repeat(np.minimum(y0 + t, y1), widths), cols, :3] = h_colors
+        image[np.repeat(np.maximum(y1 - t, y0), widths), cols, :3] = h_colors
+        image[rows, np.repeat(np.minimum(x0 + t, x1), heights), :3] = v_colors
+        image[rows, np.repeat(np.maximum(x1 - t, x0), heights), :3] = v_colors
+
+
+class GlyphCache:
+    """ Pre-rendered label texts, reused across frames
+
+        Each text is rendered once to a boolean mask with 1 pixel margin, least recently used texts are evicted.
+    """
+
+    def __init__(self, font_scale: float = DEFAULT_FONT_SCALE, thickness: int = 1,
+                 max_size: int = DEFAULT_GLYPH_CACHE_SIZE):
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.max_size = max_size
+        self.glyphs = OrderedDict()
+
+    def get(self, text: str) -> np.ndarray:
+        glyph = self.glyphs.get(text)
+        if glyph is not None:
+            self.glyphs.move_to_end(text)
+            return glyph
+
+        (width, height), baseline = cv2.getTextSize(text, FONT, self.font_scale, self.thickness)
+        mask = np.zeros((height + baseline + 2, width + 2), dtype=np.uint8)
+        cv2.putText(mask, text, (1, height + 1), FONT, self.font_scale, 255, self.thickness, cv2.LINE_8)
+        glyph = mask != 0
+
+        self.glyphs[text] = glyph
+        if len(self.glyphs) > self.max_size:
+            self.glyphs.popitem(last=False)
+        return glyph
+
+
+def draw_labels(image: np.ndarray, boxes: np.ndarray, texts: typ.List[str], colors: np.ndarray, glyphs: GlyphCache):
+    """ Draws texts on box-coloured background above the top-left corners of boxes, inside if no room above """
+    height, width = image.shape[:2]
+    for (x, y), text, color in zip(np.asarray(boxes)[:, :2].tolist(), texts, colors.tolist()):
+        glyph = glyphs.get(text)
+        glyph_height, glyph_width = glyph.shape
+        if glyph_height > height or glyph_width > width:
+            continue
+        top = y - glyph_height if y >= glyph_height else y
+        top = min(max(top, 0), height - glyph_height)
+        left = min(max(x, 0), width - glyph_width)
+
+        region = image[top:top + glyph_height, left:left + glyph_width, :3]
+        region[:] = color
+        region[glyph] = 0 if sum(color) > 382 else 255
+
+
+def draw_objects(image: np.ndarray, objects: np.ndarray, thickness: int = 1, palette: np.ndarray = PALETTE,
+                 glyphs: GlyphCache = None, labels: typ.List[str] = None, show_confidence: bool = False):
+    """ Draws objects of structured array with fields x, y, width, height (box corners), confidence and track_id
+
+        Box colour is picked from palette by track_id (class id). Labels are drawn when glyphs are given:
+        labels[track_id] if labels are given, track_id otherwise, followed by confidence if show_confidence.
+    """
+    if len(objects) == 0:
+        return
+    boxes = np.stack([objects["x"], objects["y"], objects["width"], objects["height"]], axis=1)
+    class_ids = objects["track_id"]
+    colors = palette[class_ids % len(palette)]
+
+    draw_boxes(image, boxes, colors, thickness)
+
+    if glyphs is None:
+        return
+    if labels:
+        texts = [labels[i] if 0 <= i < len(labels) else str(i) for i in class_ids.tolist()]
+    else:
+        texts = [str(i) for i in class_ids.tolist()]
+    if show_confidence:
+        texts = ["%s %.2f" % (text, confidence) for text, confidence in zip(texts, objects["confidence"].tolist())]
+    draw_labels(image, boxes, texts, colors, glyphs)
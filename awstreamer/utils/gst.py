@@ -5,7 +5,9 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import math
+import weakref
 import typing as typ
+from contextlib import contextmanager, ExitStack
 from fractions import Fraction
 
 import numpy as np
@@ -16,7 +18,7 @@ gi.require_version('GstVideo', '1.0')
 from gi.repository import Gst, GstVideo  # noqa:F401,F402
 
 
-from .gst_hacks import map_gst_buffer  # noqa:F401,F402
+from .gst_hacks import map_gst_buffer, map_gst_buffer_writable  # noqa:F401,F402
 
 
 BITS_PER_BYTE = 8
@@ -105,29 +107,247 @@ def gst_buffer_to_ndarray(buffer: Gst.Buffer, *, width: int, height: int, channe
     return result
 
 
+class VideoLayout(typ.NamedTuple):
+    """Memory layout of a video frame described by Gst.Caps
+
+        Computing the layout requires parsing caps, so compute it once per caps change
+        (e.g. in do_set_caps) and reuse it for every frame.
+
+        planes: (height, width, pixel stride in bytes) of each plane, e.g. Y and UV for NV12
+    """
+    format: GstVideo.VideoFormat
+    width: int
+    height: int
+    channels: int
+    dtype: np.dtype
+    bpp: int
+    size: int
+    strides: typ.Tuple[int, ...]
+    offsets: typ.Tuple[int, ...]
+    planes: typ.Tuple[typ.Tuple[int, int, int], ...]
+
+    @staticmethod
+    def from_caps(caps: Gst.Caps) -> 'VideoLayout':
+        """ Parses Gst.Caps into VideoLayout """
+
+        structure = caps.get_structure(0)  # Gst.Structure
+
+        # GstVideo.VideoFormat
+        video_format = gst_video_format_from_string(structure.get_value('format'))
+
+        format_info = GstVideo.VideoFormat.get_info(video_format)  # GstVideo.VideoFormatInfo
+
+        info = gst_video_info_from_caps(caps)  # GstVideo.VideoInfo
+        n_planes = format_info.n_planes
+        width, height = structure.get_value("width"), structure.get_value("height")
+
+        # Subsampled plane size is rounded up, e.g. 3x3 I420 has 2x2 U and V planes
+        planes = []
+        for plane in range(n_planes):
+            comp = [c for c in range(format_info.n_components) if format_info.plane[c] == plane][0]
+            planes.append((-(-height >> format_info.h_sub[comp]),
+                           -(-width >> format_info.w_sub[comp]),
+                           format_info.pixel_stride[comp]))
+
+        return VideoLayout(format=video_format,
+                           width=width,
+                           height=height,
+                           channels=get_num_channels(video_format),
+                           dtype=get_np_dtype(video_format),
+                           bpp=format_info.bits,
+                           size=info.size,
+                           strides=tuple(info.stride[:n_planes]),
+                           offsets=tuple(info.offset[:n_planes]),
+                           planes=tuple(planes))
+
+    def with_video_meta(self, buffer: Gst.Buffer) -> 'VideoLayout':
+        """ Returns layout with strides and offsets from GstVideo.VideoMeta of the buffer, if it differs """
+        meta = GstVideo.buffer_get_video_meta(buffer)
+        if meta is None:
+            return self
+
+        n_planes = len(self.planes)
+        strides, offsets = tuple(meta.stride[:n_planes]), tuple(meta.offset[:n_planes])
+        if strides == self.strides and offsets == self.offsets:
+            return self
+        return self._replace(strides=strides, offsets=offsets)
+
+
+class VideoLayoutCache:
+    """Keeps VideoLayout for the last seen Gst.Caps, recomputed only when caps change"""
+
+    def __init__(self):
+        self._caps = None
+        self._layout = None
+
+    def get(self, caps: Gst.Caps) -> VideoLayout:
+        # Caps are compared by pointer, reference to the last caps keeps the pointer from being reused
+        if self._caps is None or hash(caps) != hash(self._caps):
+            self._layout = VideoLayout.from_caps(caps)
+            self._caps = caps
+        return self._layout
+
+
+def gst_video_info_from_caps(caps: Gst.Caps) -> GstVideo.VideoInfo:
+    """Returns GstVideo.VideoInfo from Gst.Caps"""
+    if hasattr(GstVideo.VideoInfo, "new_from_caps"):
+        return GstVideo.VideoInfo.new_from_caps(caps)
+    info = GstVideo.VideoInfo()
+    info.from_caps(caps)
+    return info
+
+
+def _plane_to_ndarray(memory, layout: VideoLayout, plane: int) -> np.ndarray:
+    """Wraps single plane of memory with np.ndarray (height, width[, components]) without copying"""
+    itemsize = np.dtype(layout.dtype).itemsize
+    height, width, pixel_stride = layout.planes[plane]
+    stride, offset = layout.strides[plane], layout.offsets[plane]
+
+    components = pixel_stride // itemsize
+    if components <= 0:
+        # No regular pixel stride (e.g. v210), expose raw rows
+        shape, strides = (height, stride // itemsize), (stride, itemsize)
+    elif components == 1:
+        shape, strides = (height, width), (stride, itemsize)
+    else:
+        shape, strides = (height, width, components), (stride, pixel_stride, itemsize)
+
+    return np.ndarray(shape, buffer=memory, dtype=layout.dtype, offset=offset, strides=strides)
+
+
+def _memory_to_ndarray(memory, layout: VideoLayout) -> typ.Union[np.ndarray, typ.Tuple[np.ndarray, ...]]:
+    """Wraps memory (mapped buffer or bytes) with np.ndarray according to layout, without copying
+
+        Multi-planar formats (NV12, I420, ...) are returned as tuple of per-plane arrays.
+    """
+    itemsize = np.dtype(layout.dtype).itemsize
+
+    if len(layout.planes) == 1 and layout.channels > 1:
+        shape = (layout.height, layout.width, layout.channels)
+        strides = (layout.strides[0], layout.channels * itemsize, itemsize)
+        return np.ndarray(shape, buffer=memory, dtype=layout.dtype, offset=layout.offsets[0], strides=strides)
+
+    if len(layout.planes) == 1:
+        return _plane_to_ndarray(memory, layout, 0)
+
+    return tuple(_plane_to_ndarray(memory, layout, plane) for plane in range(len(layout.planes)))
+
+
+def gst_buffer_with_layout_to_ndarray(buffer: Gst.Buffer, layout: VideoLayout,
+                                      do_copy: bool = False) -> typ.Union[np.ndarray, typ.Tuple[np.ndarray, ...]]:
+    """Converts Gst.Buffer with precomputed VideoLayout to np.ndarray
+
+        Strides and offsets are taken from GstVideo.VideoMeta when the buffer carries one.
+        Multi-planar formats are returned as tuple of per-plane arrays, e.g. (Y, UV) for NV12.
+    """
+    layout = layout.with_video_meta(buffer)
+
+    if do_copy:
+        return _memory_to_ndarray(buffer.extract_dup(0, buffer.get_size()), layout)
+
+    with map_gst_buffer(buffer, Gst.MapFlags.READ) as mapped:
+        return _memory_to_ndarray(mapped, layout)
+
+
 def gst_buffer_with_pad_to_ndarray(buffer: Gst.Buffer, pad: Gst.Pad, do_copy: bool = False) -> np.ndarray:
     """Converts Gst.Buffer with Gst.Pad (stores Gst.Caps) to np.ndarray """
     return gst_buffer_with_caps_to_ndarray(buffer, pad.get_current_caps(), do_copy=do_copy)
 
 
 def gst_buffer_with_caps_to_ndarray(buffer: Gst.Buffer, caps: Gst.Caps, do_copy: bool = False) -> np.ndarray:
-    """ Converts Gst.Buffer with Gst.Caps (stores buffer info) to np.ndarray """
+    """ Converts Gst.Buffer with Gst.Caps (stores buffer info) to np.ndarray
+
+        Parses caps on every call, use gst_buffer_with_layout_to_ndarray on per-frame paths.
+    """
+    return gst_buffer_with_layout_to_ndarray(buffer, VideoLayout.from_caps(caps), do_copy=do_copy)
 
-    structure = caps.get_structure(0)  # Gst.Structure
 
-    width, height = structure.get_value("width"), structure.get_value("height")
+@contextmanager
+def map_gst_buffer_to_ndarray(buffer: Gst.Buffer, layout: VideoLayout,
+                              flags: Gst.MapFlags = Gst.MapFlags.READ) -> typ.Iterator[np.ndarray]:
+    """ Maps Gst.Buffer with VideoLayout to np.ndarray without copying
+
+        The array is backed by the mapped buffer memory and is valid only inside the with-block,
+        it is read-only unless mapped with WRITE flag. Use copy_frame(array) to keep the frame.
+        Multi-planar formats are yielded as tuple of per-plane arrays.
+
+        Example:
+            with map_gst_buffer_to_ndarray(buffer, VideoLayout.from_caps(caps)) as array:
+                // do_something with array
+    """
+    layout = layout.with_video_meta(buffer)
 
-    # GstVideo.VideoFormat
-    video_format = gst_video_format_from_string(structure.get_value('format'))
+    with map_gst_buffer(buffer, flags) as mapped:
+        array = _memory_to_ndarray(mapped, layout)
+        if not flags & Gst.MapFlags.WRITE:
+            for plane in (array if isinstance(array, tuple) else (array,)):
+                plane.flags.writeable = False
+        yield array
 
-    channels = get_num_channels(video_format)
 
-    dtype = get_np_dtype(video_format)  # np.dtype
+def copy_frame(frame: typ.Union[np.ndarray, typ.Tuple[np.ndarray, ...]]) -> typ.Union[np.ndarray, typ.Tuple[np.ndarray, ...]]:
+    """ Copies frame returned by the zero-copy functions: array, or tuple of per-plane arrays of multi-planar formats """
+    if isinstance(frame, tuple):
+        return tuple(plane.copy() for plane in frame)
+    return frame.copy()
+
+
+def gst_buffer_with_layout_to_mapped_ndarray(buffer: Gst.Buffer,
+                                             layout: VideoLayout) -> typ.Union[np.ndarray, typ.Tuple[np.ndarray, ...]]:
+    """ Maps Gst.Buffer with VideoLayout to read-only np.ndarray without copying
+
+        Unlike map_gst_buffer_to_ndarray, the mapping (and the buffer) is kept alive until
+        the array and all views of it are garbage collected, so the frame can be queued.
+        Multi-planar formats are returned as tuple of per-plane arrays, use copy_frame() to copy either.
+    """
+    stack = ExitStack()
+    array = stack.enter_context(map_gst_buffer_to_ndarray(buffer, layout))
+
+    # Unmap once all planes are gone
+    planes = array if isinstance(array, tuple) else (array,)
+    remaining = [len(planes)]
 
-    format_info = GstVideo.VideoFormat.get_info(video_format)  # GstVideo.VideoFormatInfo
+    def release():
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            stack.close()
+
+    for plane in planes:
+        weakref.finalize(plane, release)
+    return array
+
+
+class WritableMapStats:
+    """Counts frames mapped for writing and how many of them required a copy of the memory"""
+
+    def __init__(self):
+        self.frames = 0
+        self.copies = 0
+
+    def __repr__(self):
+        return "%d of %d frames required a copy to be writable" % (self.copies, self.frames)
+
+
+@contextmanager
+def map_gst_buffer_to_writable_ndarray(buffer: Gst.Buffer, layout: VideoLayout,
+                                       stats: WritableMapStats = None) -> typ.Iterator[np.ndarray]:
+    """ Maps Gst.Buffer with VideoLayout to writable np.ndarray for in-place processing
+
+        The array is valid only inside the with-block (e.g. for the lifetime of do_transform_ip).
+        If the memory is shared or split into several memories, GStreamer copies it to make
+        it writable; such copies are counted in stats.
+
+        Example:
+            with map_gst_buffer_to_writable_ndarray(buffer, self.layout, self.stats) as array:
+                // modify array in place
+    """
+    layout = layout.with_video_meta(buffer)
 
-    return gst_buffer_to_ndarray(buffer, width=width, height=height, channels=channels,
-                                 dtype=dtype, bpp=format_info.bits, do_copy=do_copy)
+    with map_gst_buffer_writable(buffer) as (mapped, copied):
+        if stats is not None:
+            stats.frames += 1
+            stats.copies += int(copied)
+        yield _memory_to_ndarray(mapped, layout)
 
 
 def get_buffer_size_from_gst_caps(caps: Gst.Caps) -> typ.Tuple[int, int]:
@@ -25,6 +25,13 @@ class _GstMapInfo(Structure):
 
 _GST_MAP_INFO_POINTER = POINTER(_GstMapInfo)
 
+
+class _GstMiniObject(Structure):
+    _fields_ = [("type", c_size_t),     # GType type
+                ("refcount", c_int),    # gint refcount
+                ("lockstate", c_int),   # gint lockstate
+                ("flags", c_uint)]      # guint flags
+
 _libgst = CDLL(os.getenv("LIB_GSTREAMER_PATH", "libgstreamer-1.0.so.0"))
 _libgst.gst_buffer_map.argtypes = [c_void_p, _GST_MAP_INFO_POINTER, c_int]
 _libgst.gst_buffer_map.restype = c_int
@@ -41,6 +48,12 @@ _libgst.gst_memory_map.restype = c_int
 _libgst.gst_memory_unmap.argtypes = [c_void_p, _GST_MAP_INFO_POINTER]
 _libgst.gst_memory_unmap.restype = None
 
+_libgst.gst_buffer_n_memory.argtypes = [c_void_p]
+_libgst.gst_buffer_n_memory.restype = c_uint
+
+_libgst.gst_buffer_peek_memory.argtypes = [c_void_p, c_uint]
+_libgst.gst_buffer_peek_memory.restype = c_void_p
+
 
 @contextmanager
 def map_gst_buffer(pbuffer: Gst.Buffer, flags: Gst.MapFlags) -> _GST_MAP_INFO_POINTER:
@@ -70,6 +83,54 @@ def map_gst_buffer(pbuffer: Gst.Buffer, flags: Gst.MapFlags) -> _GST_MAP_INFO_PO
         _libgst.gst_buffer_unmap(ptr, mapping)
 
 
+def _gst_buffer_memories(ptr: int) -> Tuple[int, ...]:
+    return tuple(_libgst.gst_buffer_peek_memory(ptr, i) for i in range(_libgst.gst_buffer_n_memory(ptr)))
+
+
+@contextmanager
+def map_gst_buffer_writable(pbuffer: Gst.Buffer) -> Tuple[_GST_MAP_INFO_POINTER, bool]:
+    """ Map Gst.Buffer with READ|WRITE flags, making it writable if needed
+
+        Python binding holds an extra reference to the buffer, so a buffer owned exclusively
+        by the element (e.g. in do_transform_ip) is reported as not writable. Such buffer is
+        mapped with the extra reference dropped for the duration of gst_buffer_map call.
+        Shared memory (or buffer with multiple memories) is then copied by GStreamer,
+        which is reported as the second value.
+
+        Example:
+            with map_gst_buffer_writable(pbuffer) as (mapped, copied):
+                // do_something with mapped
+    """
+
+    if pbuffer is None:
+        raise TypeError("Cannot pass NULL to map_gst_buffer_writable")
+
+    ptr = hash(pbuffer)
+    mini_object = _GstMiniObject.from_address(ptr)
+    memories = _gst_buffer_memories(ptr)
+
+    borrowed = _libgst.gst_mini_object_is_writable(ptr) == 0
+    if borrowed:
+        if mini_object.refcount != 2:
+            raise ValueError(
+                "Writable array requested but buffer is shared")
+        mini_object.refcount -= 1
+
+    mapping = _GstMapInfo()
+    try:
+        success = _libgst.gst_buffer_map(ptr, mapping, Gst.MapFlags.READ | Gst.MapFlags.WRITE)
+    finally:
+        if borrowed:
+            mini_object.refcount += 1
+    if not success:
+        raise RuntimeError("Couldn't map buffer")
+    try:
+        yield (cast(mapping.data, POINTER(c_byte * mapping.size)).contents,
+               _gst_buffer_memories(ptr) != memories)
+    finally:
+        _libgst.gst_buffer_unmap(ptr, mapping)
+
+
 @contextmanager
 def map_gst_memory(memory: Gst.Memory, flags: Gst.MapFlags) -> _GST_MAP_INFO_POINTER:
     """Map Gst.Memory with READ/WRITE flags
@@ -0,0 +1,99 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import typing as typ
+
+import numpy as np
+
+# Pixel step of the thumbnail compared for motion, and weight of the new frame in the background
+DEFAULT_STEP = 8
+DEFAULT_ALPHA = 0.1
+
+
+def parse_region(value: str) -> typ.Optional[typ.Tuple[float, float, float, float]]:
+    """ Parses "x0,y0,x1,y1" region, relative to the frame size (0..1), empty string is the whole frame """
+    if value is None or value.strip() == "":
+        return None
+    region = tuple(float(v) for v in value.split(","))
+    if len(region) != 4 or not (0 <= region[0] < region[2] <= 1 and 0 <= region[1] < region[3] <= 1):
+        raise ValueError("expected region x0,y0,x1,y1 within 0..1, got %s" % value)
+    return region
+
+
+class MotionGate:
+    """Detects change of the scene, comparing downscaled frames with the running average of previous ones
+
+        Mean absolute difference of the watched pixels (0..255 for 8-bit frames) above the threshold is motion,
+        threshold <= 0 disables the gate. Watched pixels are limited by region (x0, y0, x1, y1), relative
+        to the frame size, and by mask, 2D array of any size where non-zero values are watched.
+    """
+
+    def __init__(self, threshold: float, step: int = DEFAULT_STEP, alpha: float = DEFAULT_ALPHA,
+                 region: typ.Tuple[float, float, float, float] = None, mask: np.ndarray = None):
+        self.threshold = threshold
+        self.step = step
+        self.alpha = alpha
+        self.region = region
+        self.mask = mask
+        self.background = None
+        self.weights = None
+        self.gated = 0
+        self.passed = 0
+
+    def thumbnail(self, frame: typ.Union[np.ndarray, typ.Tuple[np.ndarray, ...]]) -> np.ndarray:
+        """ Subsampled frame (first plane of planar formats) """
+        plane = frame[0] if isinstance(frame, tuple) else frame
+        return plane[::self.step, ::self.step].astype(np.float32)
+
+    def compute_weights(self, height: int, width: int) -> typ.Optional[np.ndarray]:
+        """ Weights of thumbnail pixels from region and mask, summing up to 1 """
+        if self.region is None and self.mask is None:
+            return None
+
+        weights = np.ones((height, width), dtype=np.float32)
+        if self.region is not None:
+            x0, y0, x1, y1 = self.region
+            weights[:] = 0
+            weights[int(y0 * height):max(int(y1 * height), int(y0 * height) + 1),
+                    int(x0 * width):max(int(x1 * width), int(x0 * width) + 1)] = 1
+        if self.mask is not None:
+            rows = np.arange(height) * self.mask.shape[0] // height
+            cols = np.arange(width) * self.mask.shape[1] // width
+            weights *= self.mask[rows[:, np.newaxis], cols] != 0
+
+        total = weights.sum()
+        if total == 0:
+            raise ValueError("Motion region and mask leave no pixels to watch")
+        return weights / total
+
+    def check(self, frame: typ.Union[np.ndarray, typ.Tuple[np.ndarray, ...]]) -> bool:
+        """ Returns True if the frame differs from the background, and updates the background """
+        if self.threshold <= 0:
+            self.passed += 1
+            return True
+
+        thumbnail = self.thumbnail(frame)
+        if self.background is None or self.background.shape != thumbnail.shape:
+            self.background = thumbnail
+            self.weights = self.compute_weights(*thumbnail.shape[:2])
+            self.passed += 1
+            return True
+
+        diff = np.abs(thumbnail - self.background)
+        if diff.ndim == 3:
+            diff = diff.mean(axis=2)
+        score = diff.mean() if self.weights is None else (diff * self.weights).sum()
+        self.background += self.alpha * (thumbnail - self.background)
+
+        if score > self.threshold:
+            self.passed += 1
+            return True
+        self.gated += 1
+        return False
+
+    def reset(self):
+        """ Forgets the background, next frame is always motion """
+        self.background = None
+
+    def get_stats(self) -> dict:
+        return {"gated": self.gated, "passed": self.passed}
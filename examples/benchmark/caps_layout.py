@@ -0,0 +1,36 @@
+'''
+Microbenchmark of per-frame Gst.Buffer to np.ndarray conversion overhead:
+parsing caps on every frame vs. reusing VideoLayout computed once per caps change.
+
+Usage:
+    python3 caps_layout.py [width] [height] [format]
+'''
+
+import sys
+import timeit
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst  # noqa:F401,F402
+
+from awstreamer.utils.gst import VideoLayout, gst_buffer_with_caps_to_ndarray, gst_buffer_with_layout_to_ndarray
+
+Gst.init(None)
+
+ITERATIONS = 10000
+
+if __name__ == '__main__':
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 1920
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 1080
+    img_format = sys.argv[3] if len(sys.argv) > 3 else "RGB"
+
+    caps = Gst.Caps.from_string("video/x-raw,format=%s,width=%d,height=%d,framerate=30/1" % (img_format, width, height))
+    layout = VideoLayout.from_caps(caps)
+    buffer = Gst.Buffer.new_allocate(None, layout.size, None)
+
+    before = timeit.timeit(lambda: gst_buffer_with_caps_to_ndarray(buffer, caps), number=ITERATIONS)
+    after = timeit.timeit(lambda: gst_buffer_with_layout_to_ndarray(buffer, layout), number=ITERATIONS)
+
+    print("%s %dx%d, %d frames" % (img_format, width, height, ITERATIONS))
+    print("Caps parsed per frame:   %.2f us/frame" % (1e6 * before / ITERATIONS))
+    print("Cached VideoLayout:      %.2f us/frame" % (1e6 * after / ITERATIONS))
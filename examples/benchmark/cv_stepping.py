@@ -0,0 +1,78 @@
+'''
+Benchmark of frame stepping through a video file with OpenCV:
+seeking before every read (CAP_PROP_POS_FRAMES) vs. seeking once and skipping frames with grab(),
+as done by OpenCvPipeline.seek().
+
+Usage:
+    python3 cv_stepping.py [path/to/clip.mp4] [step]
+
+Without a clip, a 1000-frame test clip is generated in the current directory.
+'''
+
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+TEST_CLIP = "stepping_test_clip.mp4"
+TEST_CLIP_FRAMES = 1000
+SEEK_THRESHOLD = 30
+
+
+def make_test_clip(path, frames, width=640, height=480, fps=30):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc('m','p','4','v'), fps, (width, height))
+    for i in range(frames):
+        img = np.full((height, width, 3), i % 256, dtype=np.uint8)
+        cv2.putText(img, str(i), (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 255), 8)
+        writer.write(img)
+    writer.release()
+
+
+def step_with_seek(path, min_idx, max_idx, step):
+    source = cv2.VideoCapture(path)
+    count = 0
+    for index in range(min_idx, max_idx + 1, step):
+        source.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, img = source.read()
+        if not ret:
+            break
+        count += 1
+    return count
+
+
+def step_with_grab(path, min_idx, max_idx, step):
+    source = cv2.VideoCapture(path)
+    source.set(cv2.CAP_PROP_POS_FRAMES, min_idx)
+    position = min_idx
+    count = 0
+    for index in range(min_idx, max_idx + 1, step):
+        if index - position <= SEEK_THRESHOLD:
+            for i in range(index - position):
+                source.grab()
+        else:
+            source.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, img = source.read()
+        if not ret:
+            break
+        position = index + 1
+        count += 1
+    return count
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else TEST_CLIP
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    if not os.path.exists(path):
+        print("Generating test clip: %s" % path)
+        make_test_clip(path, TEST_CLIP_FRAMES)
+
+    max_idx = int(cv2.VideoCapture(path).get(cv2.CAP_PROP_FRAME_COUNT)) - 1
+
+    for name, func in [("seek every frame", step_with_seek), ("seek once + grab", step_with_grab)]:
+        start = time.time()
+        count = func(path, 0, max_idx, step)
+        elapsed = time.time() - start
+        print("%-18s step=%d: %d frames in %.2f s (%.1f fps)" % (name, step, count, elapsed, count / elapsed))
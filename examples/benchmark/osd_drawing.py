@@ -0,0 +1,69 @@
+'''
+Benchmark of osd drawing per frame at 10/100/1000 boxes:
+list of dicts with cv2.rectangle per box (previous osd) vs. structured array drawn in bulk by draw_objects,
+with and without labels.
+
+Usage:
+    python3 osd_drawing.py [width] [height]
+'''
+
+import sys
+import timeit
+
+import cv2
+import numpy as np
+
+from awstreamer.utils.draw import GlyphCache, draw_objects
+
+ITERATIONS = 100
+BOX_COUNTS = [10, 100, 1000]
+CLASSES = 20
+
+# Fields of the objects metadata used by draw_objects
+OBJECTS_DTYPE = np.dtype([("x", np.int32), ("y", np.int32), ("width", np.int32), ("height", np.int32),
+                          ("confidence", np.float32), ("track_id", np.int32)])
+
+
+def make_objects(count, width, height):
+    rng = np.random.default_rng(0)
+    objects = np.empty(count, dtype=OBJECTS_DTYPE)
+    objects["x"] = rng.integers(0, width - 100, count)
+    objects["y"] = rng.integers(0, height - 100, count)
+    objects["width"] = objects["x"] + rng.integers(10, 100, count)
+    objects["height"] = objects["y"] + rng.integers(10, 100, count)
+    objects["confidence"] = rng.random(count)
+    objects["track_id"] = rng.integers(0, CLASSES, count)
+    return objects
+
+
+def to_dicts(objects):
+    return [{"bounding_box": [o["x"], o["y"], o["width"], o["height"]],
+             "confidence": o["confidence"],
+             "class_name": "",
+             "track_id": o["track_id"]} for o in objects.tolist()]
+
+
+def draw_per_box(image, objects, border):
+    for r in to_dicts(objects):
+        bb = r['bounding_box']
+        cv2.rectangle(image, (bb[0], bb[1]), (bb[2], bb[3]), (0,255,0), border)
+
+
+if __name__ == '__main__':
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 1920
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 1080
+
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    labels = ["class_%d" % i for i in range(CLASSES)]
+    glyphs = GlyphCache()
+
+    print("RGBA %dx%d, %d frames, border 3" % (width, height, ITERATIONS))
+    print("%8s %18s %18s %24s" % ("boxes", "per box (ms)", "bulk (ms)", "bulk + labels (ms)"))
+    for count in BOX_COUNTS:
+        objects = make_objects(count, width, height)
+        per_box = timeit.timeit(lambda: draw_per_box(image, objects, 3), number=ITERATIONS)
+        bulk = timeit.timeit(lambda: draw_objects(image, objects, 3), number=ITERATIONS)
+        labelled = timeit.timeit(lambda: draw_objects(image, objects, 3, glyphs=glyphs, labels=labels,
+                                                      show_confidence=True), number=ITERATIONS)
+        print("%8d %18.3f %18.3f %24.3f" % (count, 1e3 * per_box / ITERATIONS, 1e3 * bulk / ITERATIONS,
+                                            1e3 * labelled / ITERATIONS))
@@ -14,6 +14,18 @@ Probe can be attached to any pad of any plugin. Syntax:
     }
 }
 
+To receive frames without copying, use:
+
+"<pad_name>": {
+    "callback": <callback_function>,
+    "zero_copy": True
+}
+
+In this mode the ndarray is read-only and valid only until the callback returns,
+call awstreamer.utils.gst.copy_frame(buffer) to retain it.
+
+Planar formats (e.g. I420, NV12) are passed as a tuple of ndarrays, one per plane.
+
 '''
 
 import awstreamer
@@ -21,9 +33,11 @@ import awstreamer
 def my_callback(buffer):
     '''
     This function will be called on every frame.
-    Buffer is a ndarray, do with it what you like!
+    Buffer is a ndarray (tuple of ndarrays for planar formats), do with it what you like!
     '''
-    print("Buffer info: %s, %s, %s" % (str(type(buffer)), str(buffer.dtype), str(buffer.shape)))
+    planes = buffer if isinstance(buffer, tuple) else (buffer,)
+    for plane in planes:
+        print("Buffer info: %s, %s, %s" % (str(type(plane)), str(plane.dtype), str(plane.shape)))
 
 
 if __name__ == '__main__':